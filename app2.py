@@ -1,16 +1,25 @@
 import os
+import json
+import time
 import uuid
 import logging
 from datetime import datetime, timezone
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
 from config.db import db
-from routes.users_routes import users_db
+from routes.users_routes import users_db, login_limiter
 from routes.conversation_routes import conversation_blueprint
-from gemini import Gemini
-from sample_vectordb import file_vectorizing
+from gemini import get_gemini
+from model_config.embed_model import warmup_embedding_model
+from model_config.rerank_model import RERANK_ENABLED, rerank_stats, warmup_rerank_model
+from db.vector_store import init_collections
+from db.conversations_db import add_query, build_query_data, cache_conversation_header, get_conversation_header
+from db.cache import cache_stats
+from prompt_builder import build_context
+from response_cache import cache_context_ids, cached_respond, get_cached_response, response_cache, store_response
+from conversation_history import build_history
+import ingestion_jobs
 import search_query
-from firebase_admin import firestore
 
 # Flask app initialization
 app = Flask(__name__)
@@ -32,6 +41,41 @@ app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
 logger.info("Application initialized and upload folder configured.")
 
+def startup():
+    """
+    One-time server startup: warms the models, prepares the vector
+    collections and optionally resumes interrupted uploads.
+
+    Runs from `python app2.py` or gunicorn's post_fork hook, never at import:
+    multiprocessing children (e.g. the password hashing pool) re-import the
+    main module as __mp_main__ and must not repeat any of this.
+    """
+    # Load the embedding model once at startup instead of on the first request
+    if os.getenv("WARMUP_EMBEDDINGS", "true").lower() in ("1", "true", "yes"):
+        try:
+            warmup_embedding_model()
+        except Exception as e:
+            logger.error("Embedding model warmup failed: %s", str(e))
+        if RERANK_ENABLED:
+            try:
+                warmup_rerank_model()
+            except Exception as e:
+                logger.error("Rerank model warmup failed: %s", str(e))
+
+    # Create payload indexes (and tenant layout) on the chunk collections
+    try:
+        init_collections()
+    except Exception as e:
+        logger.error("Vector collection initialization failed: %s", str(e))
+
+    # Re-queue uploads interrupted by a restart. Enable on one process only,
+    # otherwise every worker would pick up the same jobs.
+    if os.getenv("RESUME_INGESTION_JOBS", "false").lower() in ("1", "true", "yes"):
+        try:
+            ingestion_jobs.resume_unfinished_jobs()
+        except Exception as e:
+            logger.error("Resuming ingestion jobs failed: %s", str(e))
+
 def allowed_file(filename):
     logger.debug("Checking if the file is allowed: %s", filename)
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -49,6 +93,66 @@ def process_file(file):
     logger.info("Saved file to %s", file_path)
     return file_path
 
+def resolve_search_scope(conversation_id):
+    """
+    Returns the conversation_ids argument for document search from the request.
+
+    Defaults to the current conversation. "scope=all" searches all of the
+    user's documents, and repeated "conversation_ids" fields pick an explicit list.
+    """
+    conversation_ids = request.form.getlist("conversation_ids")
+    if conversation_ids:
+        return conversation_ids
+    if request.form.get("scope", "conversation") == "all":
+        return None
+    return conversation_id
+
+def use_response_cache():
+    """False when the request asks to bypass the response cache (no_cache=true)."""
+    return request.form.get("no_cache", "false").lower() not in ("1", "true", "yes")
+
+def retrieve_conversation_context(conversation_id, conversation_data, query_text):
+    """
+    Returns retrieved chunks for a text query, or None if there is nothing to search.
+
+    When the search is scoped to this conversation alone, a conversation
+    with no documents and no pending upload is not searched. Wider scopes
+    (scope=all or explicit conversation_ids) are always searched. Either
+    way, a pending ingestion of this conversation is awaited first when the
+    scope covers it, since only then does the query need the new vectors.
+    """
+    search_scope = resolve_search_scope(conversation_id)
+    covers_conversation = (
+        search_scope is None
+        or search_scope == conversation_id
+        or (isinstance(search_scope, list) and conversation_id in search_scope)
+    )
+    # Read from the job records, so uploads handled by other workers are seen too
+    pending = covers_conversation and ingestion_jobs.has_pending_ingestion(conversation_id)
+
+    if search_scope == conversation_id:
+        has_documents = conversation_data.get("document_count", 0) > 0
+        if not has_documents and not pending:
+            # The cached count is per worker; an upload finished by another
+            # worker only shows up in Firestore
+            fresh = get_conversation_header(conversation_id, refresh=True) or {}
+            if not fresh.get("document_count", 0) > 0:
+                return None
+
+    if pending:
+        ingestion_jobs.wait_for_conversation(conversation_id)
+    chunks = search_query.search_user_chunks(
+        query=query_text,
+        user_id=conversation_data["user_id"],
+        conversation_ids=search_scope
+    )
+    logger.info("Search results retrieved for query.")
+    return chunks
+
+def sse_event(event, data):
+    """Formats one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 def create_new_conversation_document(user_id, conversation_id, query_text=None, file_path=None, gemini_response=None):
     """Creates a Firestore conversation document."""
     logger.info("Creating new conversation document for user_id: %s, conversation_id: %s", user_id, conversation_id)
@@ -56,23 +160,20 @@ def create_new_conversation_document(user_id, conversation_id, query_text=None,
         "conversation_name": f"Conversation {datetime.now(timezone.utc).isoformat()}",
         "user_id": user_id,
         "created_at": datetime.now(timezone.utc),
-        "queries": []
+        "query_count": 0,
+        "document_count": 0
     }
+    db.collection("conversations").document(conversation_id).set(conversation_data)
+    cache_conversation_header(conversation_id, conversation_data)
 
+    queries = []
     if query_text or file_path:
-        query_id = str(uuid.uuid4())
-        query_data = {
-            "query_id": query_id,
-            "query_text": query_text,
-            "file_path": file_path,
-            "response": gemini_response,
-            "created_at": datetime.now(timezone.utc)
-        }
-        conversation_data["queries"].append(query_data)
+        query_data = build_query_data(query_text, file_path, gemini_response)
+        add_query(conversation_id, query_data)
+        queries.append(query_data)
 
-    db.collection("conversations").document(conversation_id).set(conversation_data)
     logger.info("Conversation document created successfully.")
-    return conversation_id, conversation_data
+    return conversation_id, queries
 
 @app.route("/app/conversation/new", methods=["POST"])
 def create_new_conversation():
@@ -90,40 +191,46 @@ def create_new_conversation():
         gemini_response = None
         file_path = None
 
-        # Process file if uploaded
+        # Hand uploads to the background ingestion pool and return right away
         if file:
             try:
                 file_path = process_file(file)
                 logger.info("File uploaded and processed successfully: %s", file_path)
-                vectordb_response = file_vectorizing(
-                    user_id=user_id, 
-                    conversation_id=conversation_id, 
-                    file_path=file_path
-                )
-                logger.info("Vectorization completed for file: %s", file_path)
-
-                if query_text:
-                    search_results = search_query.search_user_data(
-                        query=query_text, 
-                        user_id=user_id
-                    )
-                    logger.info("Search results retrieved for query.")
-                    model = Gemini()
-                    gemini_response = model.respond(search_results, query_text)
-                    logger.info("Gemini response generated.")
             except Exception as e:
                 logger.error("Error during file processing: %s", str(e))
                 return jsonify({"error": f"File processing error: {str(e)}"}), 400
-        
+
+            create_new_conversation_document(user_id, conversation_id)
+            job_id = ingestion_jobs.submit_ingestion(
+                user_id, conversation_id, file_path, query_text,
+                search_scope=resolve_search_scope(conversation_id),
+                use_cache=use_response_cache()
+            )
+            logger.info("Ingestion job %s queued for new conversation %s", job_id, conversation_id)
+            return jsonify({
+                "message": "File accepted for processing.",
+                "conversation_id": conversation_id,
+                "job_id": job_id,
+                "status_url": f"/app/jobs/{job_id}"
+            }), 202
+
         # If only query text without file
-        elif query_text:
+        if query_text:
             logger.info("Processing query text without file.")
-            model = Gemini()
-            gemini_response = model.respond(query_text)
+            # A new conversation has no documents, but a wider scope can still search the user's others
+            chunks = None
+            search_scope = resolve_search_scope(conversation_id)
+            if search_scope != conversation_id:
+                chunks = search_query.search_user_chunks(
+                    query=query_text,
+                    user_id=user_id,
+                    conversation_ids=search_scope
+                )
+            gemini_response = cached_respond(chunks, query_text, use_response_cache())
             logger.info("Gemini response generated for text query.")
 
         # Create conversation document
-        conversation_id, conversation_data = create_new_conversation_document(
+        conversation_id, queries = create_new_conversation_document(
             user_id, conversation_id, query_text, file_path, gemini_response
         )
 
@@ -131,7 +238,7 @@ def create_new_conversation():
         return jsonify({
             "message": "New conversation created successfully.",
             "conversation_id": conversation_id,
-            "queries": conversation_data["queries"]
+            "queries": queries
         }), 200
 
     except Exception as e:
@@ -149,64 +256,48 @@ def add_query_to_conversation(conversation_id):
             logger.warning("Both query text and file are missing.")
             return jsonify({"error": "Either query text or file is required"}), 400
 
-        conversation_ref = db.collection("conversations").document(conversation_id)
-        conversation = conversation_ref.get()
+        conversation_data = get_conversation_header(conversation_id)
 
-        if not conversation.exists:
+        if not conversation_data:
             logger.warning("Conversation ID %s not found.", conversation_id)
             return jsonify({"error": "Conversation not found"}), 404
 
-        user_id = conversation.to_dict()["user_id"]
+        user_id = conversation_data["user_id"]
         gemini_response = None
         file_path = None
 
-        # Process file if uploaded
+        # Hand uploads to the background ingestion pool and return right away
         if file:
             try:
                 file_path = process_file(file)
                 logger.info("File uploaded and processed successfully: %s", file_path)
-                vectordb_response = file_vectorizing(
-                    user_id=user_id,
-                    conversation_id=conversation_id,
-                    file_path=file_path
-                )
-                logger.info("Vectorization completed for file: %s", file_path)
-
-                if query_text:
-                    search_results = search_query.search_user_data(
-                        query=query_text,
-                        user_id=user_id
-                    )
-                    logger.info("Search results retrieved for query.")
-                    model = Gemini()
-                    gemini_response = model.respond(search_results, query_text)
-                    logger.info("Gemini response generated.")
             except Exception as e:
                 logger.error("Error during file processing: %s", str(e))
                 return jsonify({"error": f"File processing error: {str(e)}"}), 400
-        
-        # If only query text without file
-        elif query_text:
+
+            job_id = ingestion_jobs.submit_ingestion(
+                user_id, conversation_id, file_path, query_text,
+                search_scope=resolve_search_scope(conversation_id),
+                use_cache=use_response_cache()
+            )
+            logger.info("Ingestion job %s queued for conversation %s", job_id, conversation_id)
+            return jsonify({
+                "message": "File accepted for processing.",
+                "conversation_id": conversation_id,
+                "job_id": job_id,
+                "status_url": f"/app/jobs/{job_id}"
+            }), 202
+
+        # Query text without file
+        if query_text:
             logger.info("Processing query text without file.")
-            model = Gemini()
-            gemini_response = model.respond(retrieved_contents = None,
-                            user_input = query_text,
-                            history= None)
+            chunks = retrieve_conversation_context(conversation_id, conversation_data, query_text)
+            history = build_history(conversation_id, conversation_data)
+            gemini_response = cached_respond(chunks, query_text, use_response_cache(), history)
             logger.info("Gemini response generated for text query.")
 
         # Add query to conversation
-        query_id = str(uuid.uuid4())
-        query_data = {
-            "query_id": query_id,
-            "query_text": query_text,
-            "file_path": file_path,
-            "response": gemini_response,
-            "created_at": datetime.now(timezone.utc)
-        }
-
-        conversation_ref.update({
-            "queries": firestore.ArrayUnion([query_data])
-        })
+        query_id = add_query(conversation_id, build_query_data(query_text, file_path, gemini_response))
 
         logger.info("Query added to conversation ID: %s with query ID: %s", conversation_id, query_id)
         return jsonify({
@@ -219,6 +310,108 @@ def add_query_to_conversation(conversation_id):
         logger.error("Error adding query to conversation: %s", str(e))
         return jsonify({"error": str(e)}), 500
 
+@app.route("/app/conversation/<conversation_id>/stream", methods=["POST"])
+def stream_query_to_conversation(conversation_id):
+    """
+    Answers a text query as a Server-Sent Events stream.
+
+    Emits "token" events as Gemini generates text, then a "done" event with
+    the parsed response once the turn is stored, or an "error" event.
+    """
+    logger.info("Request received to stream a query for conversation ID: %s", conversation_id)
+    try:
+        query_text = request.form.get("query")
+        if not query_text:
+            logger.warning("Query text is missing.")
+            return jsonify({"error": "query is required"}), 400
+
+        conversation_data = get_conversation_header(conversation_id)
+        if not conversation_data:
+            logger.warning("Conversation ID %s not found.", conversation_id)
+            return jsonify({"error": "Conversation not found"}), 404
+
+        chunks = retrieve_conversation_context(conversation_id, conversation_data, query_text)
+        history = build_history(conversation_id, conversation_data)
+        chunk_ids = cache_context_ids(chunks, history)
+        use_cache = use_response_cache()
+        cached_response = get_cached_response(chunk_ids, query_text, use_cache)
+        model = get_gemini()
+    except Exception as e:
+        logger.error("Error preparing streamed query: %s", str(e))
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        started = time.perf_counter()
+        first_token_ms = None
+        parts = []
+        try:
+            if cached_response is not None:
+                query_id = add_query(conversation_id, build_query_data(query_text, None, cached_response))
+                total_ms = (time.perf_counter() - started) * 1000
+                logger.info("Streamed query %s served from cache.", query_id)
+                yield sse_event("done", {
+                    "query_id": query_id,
+                    "response": cached_response,
+                    "cached": True,
+                    "time_to_first_token_ms": round(total_ms),
+                    "total_ms": round(total_ms)
+                })
+                return
+
+            context = build_context(chunks)[0] if chunks else None
+            for text in model.respond_stream(context, query_text, history):
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started) * 1000
+                    logger.info("Time to first token: %.0f ms", first_token_ms)
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+
+            gemini_response = model.parse_response("".join(parts))
+            store_response(chunk_ids, query_text, gemini_response, use_cache)
+            query_id = add_query(conversation_id, build_query_data(query_text, None, gemini_response))
+            total_ms = (time.perf_counter() - started) * 1000
+            logger.info("Streamed query %s completed in %.0f ms.", query_id, total_ms)
+            yield sse_event("done", {
+                "query_id": query_id,
+                "response": gemini_response,
+                "cached": False,
+                "time_to_first_token_ms": round(first_token_ms or total_ms),
+                "total_ms": round(total_ms)
+            })
+        except Exception as e:
+            logger.error("Error streaming query response: %s", str(e))
+            yield sse_event("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/app/metrics", methods=["GET"])
+def get_metrics():
+    """Reports cache hit rates for the Firestore read-through caches and the query caches."""
+    return jsonify({
+        "firestore_cache": cache_stats(),
+        "query_embedding_cache": search_query.query_cache_stats(),
+        "response_cache": response_cache.stats(),
+        "login_rate_limiter": login_limiter.stats(),
+        "rerank": rerank_stats()
+    }), 200
+
+@app.route("/app/jobs/<job_id>", methods=["GET"])
+def get_job_status(job_id):
+    """Reports the status and per-stage progress of a background ingestion job."""
+    try:
+        job = ingestion_jobs.get_job(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        logger.error("Error retrieving job %s: %s", job_id, str(e))
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == "__main__":
     logger.info("Starting Flask application.")
+    startup()
     app.run(debug=True)
@@ -0,0 +1,90 @@
+import os
+import json
+import logging
+from db.conversations_db import get_recent_queries, update_conversation
+from gemini import get_gemini
+
+logger = logging.getLogger(__name__)
+
+# Most recent turns sent word for word; older turns live in the running summary
+HISTORY_VERBATIM_TURNS = int(os.getenv("HISTORY_VERBATIM_TURNS", "4"))
+# Older turns are folded into the summary this many at a time, so the
+# summarizer runs once every few turns rather than on every request
+HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "4"))
+# Longest rendering of a single turn's answer
+HISTORY_MAX_TURN_CHARS = int(os.getenv("HISTORY_MAX_TURN_CHARS", "1200"))
+
+
+def _render_response(response):
+    if response is None:
+        return ""
+    if isinstance(response, dict) and isinstance(response.get("response"), str):
+        text = response["response"]
+    elif isinstance(response, str):
+        text = response
+    else:
+        text = json.dumps(response, ensure_ascii=False, default=str)
+    if len(text) > HISTORY_MAX_TURN_CHARS:
+        text = text[:HISTORY_MAX_TURN_CHARS] + "..."
+    return text
+
+
+def render_turns(turns):
+    """Renders query records as alternating User/Assistant lines."""
+    lines = []
+    for turn in turns:
+        lines.append(f"User: {turn['query_text']}")
+        answer = _render_response(turn.get("response"))
+        if answer:
+            lines.append(f"Assistant: {answer}")
+    return "\n".join(lines)
+
+
+def build_history(conversation_id, conversation_data):
+    """
+    Returns the history text for the next prompt of a conversation.
+
+    The last HISTORY_VERBATIM_TURNS turns are kept verbatim. Once more than
+    HISTORY_SUMMARY_BATCH older turns are waiting, they are folded into the
+    running summary stored on the conversation document (history_summary,
+    summarized_until), so prompt size stays bounded however long the
+    conversation gets. Only the unsummarized tail of the queries
+    subcollection is read.
+
+    Returns:
+        str | None: History text, or None for a conversation with no prior turns
+    """
+    summary = conversation_data.get("history_summary") or ""
+    summarized_until = conversation_data.get("summarized_until")
+
+    window = HISTORY_VERBATIM_TURNS + HISTORY_SUMMARY_BATCH
+    recent = get_recent_queries(conversation_id, window + 1, after=summarized_until)
+    pending = [q for q in recent if q.get("query_text")]
+
+    if len(pending) > window:
+        to_fold = pending[:len(pending) - HISTORY_VERBATIM_TURNS]
+        try:
+            summary = get_gemini().summarize(summary, render_turns(to_fold))
+            update_conversation(conversation_id, {
+                "history_summary": summary,
+                "summarized_until": to_fold[-1]["created_at"]
+            })
+            pending = pending[len(to_fold):]
+            logger.info(
+                "Folded %d turns into the summary of conversation %s.",
+                len(to_fold), conversation_id
+            )
+        except Exception as e:
+            # Keep answering with the old summary and a bounded verbatim tail
+            logger.error("Error updating history summary for %s: %s", conversation_id, str(e))
+            pending = pending[-window:]
+
+    if not summary and not pending:
+        return None
+
+    parts = []
+    if summary:
+        parts.append(f"Summary of earlier conversation: {summary}")
+    if pending:
+        parts.append(render_turns(pending))
+    return "\n\n".join(parts)
@@ -0,0 +1,37 @@
+import os
+from utils.lru_cache import LRUCache
+
+# Read-through caches in front of Firestore. Entries are invalidated or
+# updated by writes made through this app; the TTL bounds staleness from
+# writes made elsewhere (other workers, the console).
+FIRESTORE_CACHE_SIZE = int(os.getenv("FIRESTORE_CACHE_SIZE", "10000"))
+FIRESTORE_CACHE_TTL = float(os.getenv("FIRESTORE_CACHE_TTL", "60")) or None
+
+# user_id -> user document
+user_cache = LRUCache(maxsize=FIRESTORE_CACHE_SIZE, ttl=FIRESTORE_CACHE_TTL)
+# conversation_id -> conversation header fields (see CONVERSATION_HEADER_FIELDS)
+conversation_cache = LRUCache(maxsize=FIRESTORE_CACHE_SIZE, ttl=FIRESTORE_CACHE_TTL)
+
+def update_cached(cache, key, changes):
+    """
+    Applies field changes to a cached entry, if present, after a write.
+
+    changes maps field names to new values, or to callables that receive
+    the old value (e.g. lambda n: (n or 0) + 1 for a counter increment).
+    """
+    entry = cache.peek(key)
+    if entry is None:
+        return
+    entry = dict(entry)
+    for field, value in changes.items():
+        entry[field] = value(entry.get(field)) if callable(value) else value
+    cache.set(key, entry)
+
+def cache_stats():
+    """
+    Returns hit-rate metrics for the Firestore caches.
+    """
+    return {
+        "users": user_cache.stats(),
+        "conversations": conversation_cache.stats()
+    }
@@ -0,0 +1,198 @@
+import uuid
+from datetime import datetime, timezone
+from config.db import db
+from firebase_admin import firestore
+from db.cache import conversation_cache, update_cached
+
+# Firestore conversations collection reference
+conversations_collection = db.collection('conversations')
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor does not name an existing record."""
+
+# Fields read when a request only needs to route or scope a query, so the
+# conversation document is fetched without anything that grows with its length
+CONVERSATION_HEADER_FIELDS = [
+    "user_id",
+    "conversation_name",
+    "created_at",
+    "query_count",
+    "document_count",
+    "history_summary",
+    "summarized_until"
+]
+
+def queries_collection(conversation_id):
+    """
+    Returns the conversations/<id>/queries subcollection reference.
+    """
+    return conversations_collection.document(conversation_id).collection('queries')
+
+def build_query_data(query_text=None, file_path=None, response=None, query_id=None):
+    """
+    Builds the record stored for one turn of a conversation.
+    """
+    return {
+        "query_id": query_id or str(uuid.uuid4()),
+        "query_text": query_text,
+        "file_path": file_path,
+        "response": response,
+        "created_at": datetime.now(timezone.utc)
+    }
+
+def add_query(conversation_id, query_data):
+    """
+    Stores a query record in the conversation's queries subcollection.
+
+    The conversation document only keeps counters, so its size stays constant
+    however many turns are added.
+    """
+    batch = db.batch()
+    batch.set(queries_collection(conversation_id).document(query_data["query_id"]), query_data)
+    counters = {
+        "query_count": firestore.Increment(1),
+        "last_query_at": query_data["created_at"]
+    }
+    if query_data.get("file_path"):
+        counters["document_count"] = firestore.Increment(1)
+    batch.update(conversations_collection.document(conversation_id), counters)
+    batch.commit()
+
+    cached_changes = {"query_count": lambda count: (count or 0) + 1}
+    if query_data.get("file_path"):
+        cached_changes["document_count"] = lambda count: (count or 0) + 1
+    update_cached(conversation_cache, conversation_id, cached_changes)
+    return query_data["query_id"]
+
+def get_conversation_header(conversation_id, refresh=False):
+    """
+    Fetches a conversation's small fields (owner, name, counters, summary),
+    served from the read-through cache when possible.
+
+    The cache is per process, so counters changed by another worker can be
+    stale; refresh=True reads Firestore and updates the cached copy.
+
+    Returns:
+        dict | None: The fields, or None if the conversation does not exist
+    """
+    if not refresh:
+        cached = conversation_cache.get(conversation_id)
+        if cached is not None:
+            return dict(cached)
+    doc = conversations_collection.document(conversation_id).get(field_paths=CONVERSATION_HEADER_FIELDS)
+    if not doc.exists:
+        conversation_cache.pop(conversation_id)
+        return None
+    header = doc.to_dict()
+    conversation_cache.set(conversation_id, header)
+    return dict(header)
+
+def update_conversation(conversation_id, update_data):
+    """
+    Updates conversation fields and keeps the cached header in step.
+    """
+    conversations_collection.document(conversation_id).update(update_data)
+    update_cached(conversation_cache, conversation_id, {
+        field: value for field, value in update_data.items() if field in CONVERSATION_HEADER_FIELDS
+    })
+
+def cache_conversation_header(conversation_id, conversation_data):
+    """
+    Primes the header cache with a conversation document this app just wrote.
+    """
+    conversation_cache.set(conversation_id, {
+        field: conversation_data[field] for field in CONVERSATION_HEADER_FIELDS if field in conversation_data
+    })
+
+def list_queries(conversation_id, limit=20, cursor=None, descending=False):
+    """
+    Reads one page of a conversation's queries ordered by creation time.
+
+    Args:
+        conversation_id (str): The conversation to read
+        limit (int): Page size
+        cursor (str): query_id of the last record of the previous page
+        descending (bool): Newest first instead of oldest first
+
+    Returns:
+        tuple: (list of query records, cursor for the next page or None)
+
+    Raises:
+        InvalidCursorError: If cursor is not a query of this conversation
+    """
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+    query = queries_collection(conversation_id).order_by("created_at", direction=direction)
+    if cursor:
+        cursor_doc = queries_collection(conversation_id).document(cursor).get()
+        if not cursor_doc.exists:
+            raise InvalidCursorError("Invalid cursor")
+        query = query.start_after(cursor_doc)
+
+    queries = [doc.to_dict() for doc in query.limit(limit).stream()]
+    next_cursor = queries[-1]["query_id"] if len(queries) == limit else None
+    return queries, next_cursor
+
+def get_recent_queries(conversation_id, limit, after=None):
+    """
+    Returns up to `limit` of the newest queries, oldest first.
+
+    Args:
+        after (datetime): Only return queries created after this time
+    """
+    query = queries_collection(conversation_id).order_by("created_at", direction=firestore.Query.DESCENDING)
+    if after is not None:
+        query = query.where("created_at", ">", after)
+    queries = [doc.to_dict() for doc in query.limit(limit).stream()]
+    queries.reverse()
+    return queries
+
+# Fields a conversation listing can be ordered by
+CONVERSATION_SORT_FIELDS = ("created_at", "conversation_name")
+
+def list_user_conversations(user_id, limit=20, cursor=None, order_by="created_at", descending=True):
+    """
+    Reads one page of a user's conversations in a single query.
+
+    Only conversation_name and created_at are fetched (field mask), so the
+    cost does not depend on how large each conversation is. Requires a
+    composite index on (user_id, <order_by>).
+
+    Args:
+        user_id (str): Owner of the conversations
+        limit (int): Page size
+        cursor (str): conversation_id of the last record of the previous page
+        order_by (str): One of CONVERSATION_SORT_FIELDS
+        descending (bool): Newest (or Z-A) first
+
+    Returns:
+        tuple: (list of conversation summaries, cursor for the next page or None)
+
+    Raises:
+        InvalidCursorError: If cursor is not one of the user's conversations
+    """
+    if order_by not in CONVERSATION_SORT_FIELDS:
+        raise ValueError(f"Unsupported order_by field: {order_by}")
+
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+    query = (
+        conversations_collection
+        .where("user_id", "==", user_id)
+        .select(["conversation_name", "created_at"])
+        .order_by(order_by, direction=direction)
+    )
+    if cursor:
+        cursor_doc = conversations_collection.document(cursor).get(field_paths=["user_id", order_by])
+        if not cursor_doc.exists or cursor_doc.get("user_id") != user_id:
+            raise InvalidCursorError("Invalid cursor")
+        query = query.start_after(cursor_doc)
+
+    conversations = []
+    for doc in query.limit(limit).stream():
+        data = doc.to_dict()
+        conversations.append({
+            "conversation_id": doc.id,
+            "conversation_name": data.get("conversation_name", "Unnamed Conversation"),
+            "created_at": data.get("created_at")
+        })
+    next_cursor = conversations[-1]["conversation_id"] if len(conversations) == limit else None
+    return conversations, next_cursor
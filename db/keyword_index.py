@@ -0,0 +1,165 @@
+import os
+import re
+import json
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_INDEX_ENABLED = os.getenv("KEYWORD_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+KEYWORD_INDEX_PATH = os.getenv("KEYWORD_INDEX_PATH", os.path.join("cache", "keyword_index.sqlite3"))
+
+# Word tokens (letters, digits, underscore) in a query; anything else, including
+# FTS5 operators, is dropped before matching
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(query):
+    """
+    Turns free text into an FTS5 MATCH expression: every token quoted and
+    OR-ed, so BM25 ranks chunks by how many (and how rare) terms they share.
+
+    Returns:
+        str | None: The expression, or None if the query has no tokens
+    """
+    tokens = list(dict.fromkeys(token.lower() for token in _TOKEN_PATTERN.findall(query or "")))
+    if not tokens:
+        return None
+    return " OR ".join(f'"{token}"' for token in tokens)
+
+
+class KeywordIndex:
+    """
+    BM25 keyword index over uploaded chunks, stored in SQLite FTS5.
+
+    Chunks live in a plain table keyed by the Qdrant point ID (so re-ingesting
+    a file replaces its rows) and an external-content FTS5 table kept in step
+    by triggers. Every search is restricted to one user's chunks, optionally
+    to some of their conversations.
+    """
+
+    def __init__(self, path=KEYWORD_INDEX_PATH):
+        self.path = path
+        self.searches = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY,
+                point_id TEXT NOT NULL UNIQUE,
+                user_id TEXT NOT NULL,
+                conversation_id TEXT,
+                page_content TEXT NOT NULL,
+                metadata TEXT
+            );
+            CREATE INDEX IF NOT EXISTS chunks_user ON chunks (user_id, conversation_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                page_content, content='chunks', content_rowid='rowid',
+                tokenize='porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, page_content) VALUES (new.rowid, new.page_content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, page_content)
+                VALUES ('delete', old.rowid, old.page_content);
+            END;
+            """
+        )
+        self._conn.commit()
+
+    def add_chunks(self, user_id, conversation_id, chunks):
+        """
+        Indexes chunks, replacing any previously stored under the same point IDs.
+
+        Args:
+            chunks (list[tuple]): (point_id, page_content, metadata) triples
+        """
+        if not chunks:
+            return
+        rows = [
+            (str(point_id), user_id, conversation_id, page_content, json.dumps(metadata or {}, default=str))
+            for point_id, page_content, metadata in chunks
+        ]
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE point_id = ?", [(row[0],) for row in rows])
+            self._conn.executemany(
+                "INSERT INTO chunks (point_id, user_id, conversation_id, page_content, metadata)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def search(self, query, user_id, limit=5, conversation_ids=None):
+        """
+        Returns the user's chunks that best match query by BM25.
+
+        Args:
+            conversation_ids (str | list[str] | None): Restrict to one
+                conversation or several; None searches all of the user's chunks
+
+        Returns:
+            list[dict]: Chunks with id, score, page_content and metadata, best first
+        """
+        match = build_match_query(query)
+        if match is None:
+            return []
+
+        sql = (
+            "SELECT c.point_id, c.page_content, c.metadata, bm25(chunks_fts) AS rank"
+            " FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid"
+            " WHERE chunks_fts MATCH ? AND c.user_id = ?"
+        )
+        params = [match, user_id]
+        if isinstance(conversation_ids, str):
+            conversation_ids = [conversation_ids]
+        if conversation_ids is not None:
+            if not conversation_ids:
+                return []
+            sql += f" AND c.conversation_id IN ({','.join('?' * len(conversation_ids))})"
+            params.extend(conversation_ids)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            self.searches += 1
+        # bm25() is lower-is-better; negate so higher scores are better as in Qdrant
+        return [
+            {
+                "id": point_id,
+                "score": -rank,
+                "page_content": page_content,
+                "metadata": json.loads(metadata) if metadata else {}
+            }
+            for point_id, page_content, metadata, rank in rows
+        ]
+
+    def stats(self):
+        with self._lock:
+            chunks = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            return {"chunks": chunks, "searches": self.searches, "path": self.path}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_keyword_index():
+    """Returns the process-wide keyword index, or None when disabled."""
+    global _index
+    if not KEYWORD_INDEX_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = KeywordIndex()
+    return _index
@@ -0,0 +1,239 @@
+"""
+Applies the configured vector storage settings (VECTOR_QUANTIZATION,
+VECTOR_ON_DISK) to existing chunk collections.
+
+Usage:
+    python -m db.migrate_collection [--mode update|rebuild|repartition] [--collection NAME] [--dry-run]
+
+"update" (default) changes the quantization and on-disk settings in place;
+Qdrant rebuilds the segments in the background while search keeps working.
+"rebuild" copies every point into a staging collection created with the new
+settings, recreates the original from scratch and copies the points back.
+Use it when in-place updates are not supported by the server. Searches fail
+while the original is being recreated. Re-running a rebuild after a failure
+resumes from the staging collection.
+"repartition" moves points into the collection VECTOR_TENANT_MODE assigns
+their user (e.g. from GenMind_3 into its shards after switching to
+"sharded", or back), then drops source collections left empty. Moves are
+upserts by point ID, so it can be re-run after a failure.
+"""
+import logging
+import argparse
+from qdrant_client.models import Disabled, PointIdsList, PointStruct, VectorParamsDiff
+from db.vector_store import (
+    COLLECTION_NAME,
+    VECTOR_ON_DISK,
+    VECTOR_QUANTIZATION,
+    VECTOR_TENANT_MODE,
+    all_collections,
+    collection_for_user,
+    get_vector_store,
+    quantization_config
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCROLL_BATCH_SIZE = 256
+STAGING_SUFFIX = "_rebuild"
+
+
+def describe(client, collection_name):
+    """Returns the current quantization, on-disk flag, vector size and point count."""
+    info = client.get_collection(collection_name)
+    vectors = info.config.params.vectors
+    return {
+        "collection": collection_name,
+        "points": client.count(collection_name, exact=True).count,
+        "vector_size": vectors.size,
+        "on_disk": bool(vectors.on_disk),
+        "quantization": info.config.quantization_config
+    }
+
+
+def copy_points(vector_store, source, target, batch_size=SCROLL_BATCH_SIZE):
+    """
+    Copies every point (ID, vector, payload) from source to target.
+
+    Returns:
+        int: Number of points copied
+    """
+    copied = 0
+    offset = None
+    while True:
+        records, offset = vector_store.client.scroll(
+            collection_name=source,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        if records:
+            vector_store.upsert(target, [
+                PointStruct(id=record.id, vector=record.vector, payload=record.payload)
+                for record in records
+            ])
+            copied += len(records)
+            logger.info("Copied %d points from %s to %s.", copied, source, target)
+        if offset is None:
+            return copied
+
+
+def _verify(client, source, target):
+    source_count = client.count(source, exact=True).count
+    target_count = client.count(target, exact=True).count
+    if target_count < source_count:
+        raise RuntimeError(f"{target} has {target_count} points, expected {source_count}.")
+
+
+def update_in_place(vector_store, collection_name):
+    """Switches quantization and on-disk storage on an existing collection."""
+    config = quantization_config()
+    vector_store.client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": VectorParamsDiff(on_disk=VECTOR_ON_DISK)},
+        # A None config would leave quantization unchanged, so disable explicitly
+        quantization_config=config if config is not None else Disabled.DISABLED
+    )
+    logger.info(
+        "Updated %s in place (quantization=%s, on_disk=%s).",
+        collection_name, VECTOR_QUANTIZATION, VECTOR_ON_DISK
+    )
+
+
+def rebuild(vector_store, collection_name):
+    """Recreates a collection with the new settings, keeping every point."""
+    client = vector_store.client
+    staging = collection_name + STAGING_SUFFIX
+
+    if client.collection_exists(collection_name):
+        vector_size = describe(client, collection_name)["vector_size"]
+        if not client.collection_exists(staging):
+            vector_store.create_collection(staging, vector_size)
+        copy_points(vector_store, collection_name, staging)
+        _verify(client, collection_name, staging)
+        client.delete_collection(collection_name)
+        logger.info("Dropped %s; its points are in %s.", collection_name, staging)
+    elif client.collection_exists(staging):
+        # Resuming after a failure between the drop and the copy back
+        vector_size = describe(client, staging)["vector_size"]
+    else:
+        logger.info("Collection %s does not exist; nothing to rebuild.", collection_name)
+        return
+
+    vector_store.create_collection(collection_name, vector_size)
+    vector_store.ensure_payload_indexes(collection_name)
+    copy_points(vector_store, staging, collection_name)
+    _verify(client, staging, collection_name)
+    client.delete_collection(staging)
+    logger.info("Rebuilt %s.", collection_name)
+
+
+def _chunk_collections(client):
+    """Returns every existing chunk collection, shards of any count included."""
+    names = [collection.name for collection in client.get_collections().collections]
+    return [
+        name for name in names
+        if (name == COLLECTION_NAME or name.startswith(COLLECTION_NAME + "_shard_"))
+    ]
+
+
+def repartition(vector_store, dry_run=False, batch_size=SCROLL_BATCH_SIZE):
+    """
+    Moves every point into the collection its user belongs to under the
+    current VECTOR_TENANT_MODE.
+
+    Returns:
+        int: Number of points moved
+    """
+    client = vector_store.client
+    targets = set(all_collections())
+    moved = 0
+    for source in _chunk_collections(client):
+        vector_size = describe(client, source)["vector_size"]
+        offset = None
+        while True:
+            records, offset = client.scroll(
+                collection_name=source,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=not dry_run
+            )
+            by_target = {}
+            for record in records:
+                user_id = ((record.payload or {}).get("metadata") or {}).get("user_id")
+                if not user_id:
+                    logger.warning("Point %s in %s has no user_id; left in place.", record.id, source)
+                    continue
+                target = collection_for_user(user_id)
+                if target != source:
+                    by_target.setdefault(target, []).append(record)
+
+            for target, batch in by_target.items():
+                if dry_run:
+                    moved += len(batch)
+                    continue
+                vector_store.ensure_collection(target, vector_size)
+                vector_store.upsert(target, [
+                    PointStruct(id=record.id, vector=record.vector, payload=record.payload)
+                    for record in batch
+                ])
+                client.delete(
+                    collection_name=source,
+                    points_selector=PointIdsList(points=[record.id for record in batch]),
+                    wait=True
+                )
+                moved += len(batch)
+                logger.info("Moved %d points from %s to %s.", len(batch), source, target)
+            if offset is None:
+                break
+
+        if not dry_run and source not in targets and client.count(source, exact=True).count == 0:
+            client.delete_collection(source)
+            logger.info("Dropped %s, which tenant mode %s no longer uses.", source, VECTOR_TENANT_MODE)
+
+    logger.info("%s %d points for tenant mode %s.", "Would move" if dry_run else "Moved", moved, VECTOR_TENANT_MODE)
+    return moved
+
+
+def migrate_all(mode="update", collection_name=None, dry_run=False):
+    """
+    Applies the configured storage settings to one collection or all chunk collections.
+
+    Returns:
+        list[dict]: Collection descriptions before migration
+    """
+    vector_store = get_vector_store()
+    client = vector_store.client
+    if mode == "repartition":
+        repartition(vector_store, dry_run=dry_run)
+        return []
+    names = [collection_name] if collection_name else all_collections()
+    before = []
+    for name in names:
+        if not client.collection_exists(name) and not client.collection_exists(name + STAGING_SUFFIX):
+            continue
+        if client.collection_exists(name):
+            before.append(describe(client, name))
+            logger.info("Current settings: %s", before[-1])
+        if dry_run:
+            logger.info(
+                "[dry run] Would %s %s with quantization=%s, on_disk=%s.",
+                mode, name, VECTOR_QUANTIZATION, VECTOR_ON_DISK
+            )
+            continue
+        if mode == "rebuild":
+            rebuild(vector_store, name)
+        elif before and before[-1]["collection"] == name:
+            update_in_place(vector_store, name)
+    return before
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply quantization and on-disk settings to chunk collections.")
+    parser.add_argument("--mode", choices=["update", "rebuild", "repartition"], default="update")
+    parser.add_argument("--collection", help="Migrate a single collection")
+    parser.add_argument("--dry-run", action="store_true", help="Report current settings without changing anything")
+    args = parser.parse_args()
+    migrate_all(mode=args.mode, collection_name=args.collection, dry_run=args.dry_run)
@@ -0,0 +1,97 @@
+"""
+Moves conversation queries from the legacy `queries` array on each
+conversations/<id> document into the conversations/<id>/queries subcollection.
+
+Usage:
+    python -m db.migrate_queries [--dry-run] [--conversation-id ID]
+
+Query records are written under their query_id, so the migration can be
+re-run safely; the array field is only removed once its records are stored.
+"""
+import uuid
+import logging
+import argparse
+from config.db import db
+from firebase_admin import firestore
+from db.conversations_db import conversations_collection, queries_collection
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Firestore allows 500 writes per batch
+BATCH_SIZE = 450
+
+def migrate_conversation(conversation_id, legacy_queries, dry_run=False):
+    """
+    Copies one conversation's legacy queries into its subcollection.
+
+    Returns:
+        int: Number of query records migrated
+    """
+    if dry_run:
+        logger.info("[dry run] Would migrate %d queries of conversation %s.", len(legacy_queries), conversation_id)
+        return len(legacy_queries)
+
+    for start in range(0, len(legacy_queries), BATCH_SIZE):
+        batch = db.batch()
+        for query_data in legacy_queries[start:start + BATCH_SIZE]:
+            query_data = dict(query_data)
+            query_data.setdefault("query_id", str(uuid.uuid4()))
+            batch.set(queries_collection(conversation_id).document(query_data["query_id"]), query_data)
+        batch.commit()
+
+    # Recount from the subcollection so turns added since the deploy are included
+    query_count = 0
+    document_count = 0
+    last_query_at = None
+    for doc in queries_collection(conversation_id).select(["file_path", "created_at"]).stream():
+        record = doc.to_dict()
+        query_count += 1
+        if record.get("file_path"):
+            document_count += 1
+        created_at = record.get("created_at")
+        if created_at and (last_query_at is None or created_at > last_query_at):
+            last_query_at = created_at
+
+    conversations_collection.document(conversation_id).update({
+        "queries": firestore.DELETE_FIELD,
+        "query_count": query_count,
+        "document_count": document_count,
+        "last_query_at": last_query_at
+    })
+    logger.info("Migrated %d queries of conversation %s.", len(legacy_queries), conversation_id)
+    return len(legacy_queries)
+
+def migrate_all(conversation_id=None, dry_run=False):
+    """
+    Migrates every conversation that still has a legacy queries array.
+
+    Returns:
+        dict: Counts of conversations and queries migrated
+    """
+    if conversation_id:
+        docs = [conversations_collection.document(conversation_id).get()]
+    else:
+        docs = conversations_collection.select(["queries"]).stream()
+
+    conversations = 0
+    queries = 0
+    for doc in docs:
+        if not doc.exists:
+            continue
+        legacy_queries = (doc.to_dict() or {}).get("queries")
+        if not isinstance(legacy_queries, list):
+            continue
+        if legacy_queries or not dry_run:
+            queries += migrate_conversation(doc.id, legacy_queries, dry_run)
+            conversations += 1
+
+    logger.info("Migration finished: %d conversations, %d queries.", conversations, queries)
+    return {"conversations": conversations, "queries": queries}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move conversation queries into a subcollection.")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be migrated without writing")
+    parser.add_argument("--conversation-id", help="Migrate a single conversation")
+    args = parser.parse_args()
+    migrate_all(conversation_id=args.conversation_id, dry_run=args.dry_run)
@@ -0,0 +1,76 @@
+"""
+Creates the emails/<email> and phones/<phone> lookup documents for users
+registered before registration and login switched to them.
+
+Usage:
+    python -m db.migrate_user_lookups [--dry-run]
+
+Existing lookup documents are left alone, so the migration can be re-run
+safely. Conflicts (an email or phone shared by two users) are logged and
+skipped for manual cleanup.
+"""
+import logging
+import argparse
+from config.db import db
+from db.users_db import users_collection, emails_collection, phones_collection, email_key, phone_key
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Firestore allows 500 writes per batch
+BATCH_SIZE = 450
+
+def _claim(collection, key, user_id, claimed, conflicts):
+    """Records a lookup to create, or a conflict if another user owns it."""
+    ref = collection.document(key)
+    owner = claimed.get(ref.path)
+    if owner is None:
+        snapshot = ref.get()
+        owner = snapshot.to_dict().get('user_id') if snapshot.exists else None
+    if owner is not None and owner != user_id:
+        conflicts.append((ref.path, owner, user_id))
+        return None
+    claimed[ref.path] = user_id
+    return None if owner == user_id else ref
+
+def migrate_all(dry_run=False):
+    """
+    Backfills lookup documents for every user.
+
+    Returns:
+        dict: Counts of lookups created and conflicts found
+    """
+    claimed = {}
+    conflicts = []
+    pending = []
+    for doc in users_collection.select(['email', 'phone_number']).stream():
+        user = doc.to_dict()
+        if user.get('email'):
+            ref = _claim(emails_collection, email_key(user['email']), doc.id, claimed, conflicts)
+            if ref is not None:
+                pending.append((ref, doc.id))
+        if user.get('phone_number'):
+            ref = _claim(phones_collection, phone_key(user['phone_number']), doc.id, claimed, conflicts)
+            if ref is not None:
+                pending.append((ref, doc.id))
+
+    for path, owner, user_id in conflicts:
+        logger.warning("Lookup %s belongs to user %s; skipped for user %s.", path, owner, user_id)
+
+    if dry_run:
+        logger.info("[dry run] Would create %d lookup documents.", len(pending))
+    else:
+        for start in range(0, len(pending), BATCH_SIZE):
+            batch = db.batch()
+            for ref, user_id in pending[start:start + BATCH_SIZE]:
+                batch.set(ref, {'user_id': user_id})
+            batch.commit()
+        logger.info("Created %d lookup documents.", len(pending))
+
+    return {"lookups": len(pending), "conflicts": len(conflicts)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill email and phone lookup documents for users.")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be created without writing")
+    args = parser.parse_args()
+    migrate_all(dry_run=args.dry_run)
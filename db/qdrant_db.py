@@ -0,0 +1,65 @@
+import os
+import logging
+import threading
+from qdrant_client import QdrantClient
+
+logger = logging.getLogger(__name__)
+
+# Connection settings; without QDRANT_URL the client from config.vector_db is reused
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "30"))
+
+# Embedded (in-process) Qdrant storage used by the local backend
+QDRANT_LOCAL_PATH = os.getenv("QDRANT_LOCAL_PATH", os.path.join("data", "qdrant"))
+
+_client = None
+_local_clients = {}
+_client_lock = threading.Lock()
+
+
+def get_qdrant_client():
+    """
+    Returns the process-wide Qdrant client shared by ingestion and search.
+
+    The client keeps its HTTP (keep-alive) or gRPC connections open, so
+    requests after the first skip connection setup.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if QDRANT_URL:
+                    _client = QdrantClient(
+                        url=QDRANT_URL,
+                        api_key=QDRANT_API_KEY,
+                        prefer_grpc=QDRANT_PREFER_GRPC,
+                        timeout=QDRANT_TIMEOUT
+                    )
+                    logger.info("Qdrant client created for %s (prefer_grpc=%s).", QDRANT_URL, QDRANT_PREFER_GRPC)
+                else:
+                    from config.vector_db import qdrant_client
+                    _client = qdrant_client
+    return _client
+
+
+def get_local_qdrant_client(path=QDRANT_LOCAL_PATH):
+    """
+    Returns an embedded Qdrant client that stores vectors on local disk.
+
+    Searches run in-process with no network round trip. Qdrant's local mode
+    locks its storage directory, so only one process may open a given path;
+    pass ":memory:" for a throwaway in-memory store (tests).
+    """
+    with _client_lock:
+        client = _local_clients.get(path)
+        if client is None:
+            if path == ":memory:":
+                client = QdrantClient(location=":memory:")
+            else:
+                os.makedirs(path, exist_ok=True)
+                client = QdrantClient(path=path)
+            _local_clients[path] = client
+            logger.info("Local Qdrant client opened at %s.", path)
+        return client
@@ -2,13 +2,52 @@ from config.db import db
 from datetime import datetime
 from firebase_admin import firestore
 from datetime import datetime, timezone 
+from db.cache import user_cache
 
 # Firestore users collection reference
 users_collection = db.collection('users')
 
+# Lookup documents keyed by email and phone number. Each holds the owning
+# user_id and is written in the same transaction as the user document, so
+# uniqueness holds under concurrent sign-ups and lookups are direct gets.
+emails_collection = db.collection('emails')
+phones_collection = db.collection('phones')
+
+class DuplicateUserError(ValueError):
+    """Raised when an email or phone number already belongs to another user."""
+
+def email_key(email):
+    # Case-sensitive, like the email equality queries the lookups replaced
+    return str(email).strip()
+
+def phone_key(phone_number):
+    return str(phone_number).strip()
+
+def _lookup_refs(email=None, phone_number=None):
+    refs = []
+    if email:
+        refs.append(emails_collection.document(email_key(email)))
+    if phone_number:
+        refs.append(phones_collection.document(phone_key(phone_number)))
+    return refs
+
+@firestore.transactional
+def _create_user_transaction(transaction, user_ref, user_data):
+    lookup_refs = _lookup_refs(user_data['email'], user_data['phone_number'])
+    for snapshot in db.get_all(lookup_refs, transaction=transaction):
+        if snapshot.exists:
+            raise DuplicateUserError("User with this email or phone already exists")
+    for ref in lookup_refs:
+        transaction.create(ref, {'user_id': user_ref.id})
+    transaction.set(user_ref, user_data)
+
 def create_user(name, email, hashed_password, phone_number):
     """
-    Creates a new user in the Firestore 'users' collection.
+    Creates a new user in the Firestore 'users' collection together with its
+    email and phone lookup documents, in one transaction.
+
+    Raises:
+        DuplicateUserError: If the email or phone number is already registered
     """
     user_data = {
         'name': name.lower(),
@@ -17,70 +56,190 @@ def create_user(name, email, hashed_password, phone_number):
         'phone_number': phone_number,
         'created_at': datetime.now(timezone.utc)
     }
-    result = users_collection.add(user_data)
-    print("Creation result:", result)
-    print("Generated User ID:", result[1])
-    return result[1].id
+    user_ref = users_collection.document()
+    _create_user_transaction(db.transaction(), user_ref, user_data)
+    print("Generated User ID:", user_ref.id)
+    return user_ref.id
+
+# Fields returned by user listings; the password hash is never included
+PUBLIC_USER_FIELDS = ['name', 'email', 'phone_number', 'created_at', 'last_login', 'conversation_ids']
+
+def _public_user(doc):
+    user = doc.to_dict()
+    user['_id'] = doc.id
+    if 'name' in user:
+        user['name'] = user['name'].lower()  # Optional: Normalize name to lowercase
+    return user
 
 def get_all_users():
     """
-    Retrieves all users from the Firestore 'users' collection.
+    Retrieves all users from the Firestore 'users' collection (without password hashes).
     """
-    users = []
-    for doc in users_collection.stream():
-        user = doc.to_dict()
-        user['_id'] = doc.id
-        user['name'] = user['name'].lower()  # Optional: Normalize name to lowercase
-        users.append(user)
-    return users
+    return list(iter_users())
+
+def iter_users():
+    """
+    Yields users one at a time as Firestore streams them, so memory use does
+    not depend on the size of the collection.
+    """
+    for doc in users_collection.select(PUBLIC_USER_FIELDS).stream():
+        yield _public_user(doc)
+
+def list_users(limit=100, cursor=None):
+    """
+    Reads one page of users ordered by document ID.
+
+    Args:
+        limit (int): Page size
+        cursor (str): _id of the last user of the previous page
+
+    Returns:
+        tuple: (list of users, cursor for the next page or None)
+    """
+    query = users_collection.select(PUBLIC_USER_FIELDS).order_by(firestore.FieldPath.document_id())
+    if cursor:
+        query = query.start_after({firestore.FieldPath.document_id(): users_collection.document(cursor)})
+    users = [_public_user(doc) for doc in query.limit(limit).stream()]
+    next_cursor = users[-1]['_id'] if len(users) == limit else None
+    return users, next_cursor
 
 def get_user_by_id(user_id):
     """
-    Fetches a user document by its ID.
+    Fetches a user document by its ID, served from the read-through cache when possible.
     """
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return dict(cached)
     try:
         doc = users_collection.document(user_id).get()
         print("Fetched user:", doc.to_dict())
-        return doc.to_dict() if doc.exists else None
+        if not doc.exists:
+            return None
+        user = doc.to_dict()
+        user_cache.set(user_id, user)
+        return dict(user)
     except Exception as e:
         raise ValueError("Invalid User ID") from e
 
+def invalidate_user(user_id):
+    """
+    Drops a user from the read-through cache after a write.
+    """
+    user_cache.pop(user_id)
+
+@firestore.transactional
+def _update_user_transaction(transaction, user_ref, update_data):
+    snapshot = user_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise ValueError("Invalid User ID")
+    current = snapshot.to_dict()
+
+    stale_refs, new_refs = [], []
+    if 'email' in update_data and email_key(update_data['email']) != email_key(current.get('email', '')):
+        stale_refs += _lookup_refs(email=current.get('email'))
+        new_refs += _lookup_refs(email=update_data['email'])
+    if 'phone_number' in update_data and phone_key(update_data['phone_number']) != phone_key(current.get('phone_number', '')):
+        stale_refs += _lookup_refs(phone_number=current.get('phone_number'))
+        new_refs += _lookup_refs(phone_number=update_data['phone_number'])
+
+    lookups = db.get_all(new_refs, transaction=transaction) if new_refs else []
+    for lookup in lookups:
+        if lookup.exists and lookup.to_dict().get('user_id') != user_ref.id:
+            raise DuplicateUserError("User with this email or phone already exists")
+    for ref in stale_refs:
+        transaction.delete(ref)
+    for ref in new_refs:
+        transaction.set(ref, {'user_id': user_ref.id})
+    transaction.update(user_ref, update_data)
+
 def update_user(user_id, update_data):
     """
-    Updates an existing user document.
+    Updates an existing user document. Email and phone changes move the
+    lookup documents in the same transaction.
+
+    Raises:
+        DuplicateUserError: If the new email or phone number belongs to another user
     """
     try:
-        users_collection.document(user_id).update(update_data)
+        if 'email' in update_data or 'phone_number' in update_data:
+            _update_user_transaction(db.transaction(), users_collection.document(user_id), update_data)
+        else:
+            users_collection.document(user_id).update(update_data)
+    except DuplicateUserError:
+        raise
     except Exception as e:
         raise ValueError("Invalid User ID") from e
+    finally:
+        invalidate_user(user_id)
 
-def get_user_by_email_or_phone(email=None, phone_number=None):
+def get_user_id_by_email_or_phone(email=None, phone_number=None):
     """
-    Fetches a user document by email, phone number, or both.
+    Resolves a user ID from the email/phone lookup documents with direct
+    gets. When both are given they must belong to the same user.
     """
-    query = None
-    if email and phone_number:
-        query = users_collection.where('email', '==', email).where('phone_number', '==', phone_number)
-    elif email:
-        query = users_collection.where('email', '==', email)
-    elif phone_number:
-        query = users_collection.where('phone_number', '==', phone_number)
+    refs = _lookup_refs(email, phone_number)
+    if not refs:
+        return None
+    user_ids = set()
+    for snapshot in db.get_all(refs):
+        if not snapshot.exists:
+            return None
+        user_ids.add(snapshot.to_dict().get('user_id'))
+    return user_ids.pop() if len(user_ids) == 1 else None
 
-    if query:
-        results = []
-        for doc in query.stream():
-            user_data = doc.to_dict()
-            user_data['_id'] = doc.id  # Include the document ID
-            results.append(user_data)
-        return results[0] if results else None
+def is_registered(email=None, phone_number=None):
+    """
+    Returns True if the email or the phone number already belongs to a user.
+
+    A cheap pre-check that lets registration reject duplicates before paying
+    for a password hash; create_user still enforces uniqueness atomically.
+    """
+    refs = _lookup_refs(email, phone_number)
+    return any(snapshot.exists for snapshot in db.get_all(refs)) if refs else False
+
+def get_user_by_email_or_phone(email=None, phone_number=None, use_cache=True):
+    """
+    Fetches a user document by email, phone number, or both.
+
+    Pass use_cache=False when checking credentials: the read-through cache is
+    per process, so a password changed through another worker could still
+    be served from it until the TTL runs out.
+    """
+    user_id = get_user_id_by_email_or_phone(email=email, phone_number=phone_number)
+    if not user_id:
+        return None
+    if use_cache:
+        user = get_user_by_id(user_id)
+    else:
+        doc = users_collection.document(user_id).get()
+        user = doc.to_dict() if doc.exists else None
+    if user is None:
+        return None
+    user['_id'] = user_id  # Include the document ID
+    return user
 
-    return None
+@firestore.transactional
+def _delete_user_transaction(transaction, user_ref):
+    snapshot = user_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return
+    user = snapshot.to_dict()
+    lookup_refs = _lookup_refs(user.get('email'), user.get('phone_number'))
+    lookups = db.get_all(lookup_refs, transaction=transaction) if lookup_refs else []
+    for lookup in lookups:
+        # Leave lookups another user has since claimed
+        if lookup.exists and lookup.to_dict().get('user_id') == user_ref.id:
+            transaction.delete(lookup.reference)
+    transaction.delete(user_ref)
 
 def delete_user(user_id):
     """
-    Deletes a user document by its ID.
+    Deletes a user document by its ID, along with the lookup documents that
+    still point at it.
     """
     try:
-        users_collection.document(user_id).delete()
+        _delete_user_transaction(db.transaction(), users_collection.document(user_id))
     except Exception as e:
         raise ValueError("Invalid User ID") from e
+    finally:
+        invalidate_user(user_id)
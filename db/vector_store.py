@@ -0,0 +1,347 @@
+import os
+import time
+import zlib
+import random
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Distance,
+    HnswConfigDiff,
+    KeywordIndexParams,
+    KeywordIndexType,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams
+)
+from db.qdrant_db import QDRANT_LOCAL_PATH, get_local_qdrant_client, get_qdrant_client
+
+logger = logging.getLogger(__name__)
+
+# "remote" uses the hosted Qdrant server, "local" an embedded on-disk store,
+# "memory" an embedded in-memory store (tests)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "remote").lower()
+
+# Shared collection for all users' document chunks
+COLLECTION_NAME = "GenMind_3"
+
+# How users' chunks are partitioned:
+#   "shared"  - one collection, keyword indexes on user and conversation IDs
+#   "tenant"  - one collection, user_id indexed with is_tenant and per-tenant
+#               HNSW graphs only (m=0, payload_m), Qdrant's multitenancy layout
+#   "sharded" - users hashed across VECTOR_SHARD_COUNT collections
+VECTOR_TENANT_MODE = os.getenv("VECTOR_TENANT_MODE", "shared").lower()
+VECTOR_SHARD_COUNT = int(os.getenv("VECTOR_SHARD_COUNT", "8"))
+TENANT_PAYLOAD_M = int(os.getenv("VECTOR_TENANT_PAYLOAD_M", "16"))
+
+USER_ID_FIELD = "metadata.user_id"
+CONVERSATION_ID_FIELD = "metadata.conversation_id"
+
+# Vector compression for new (or migrated) collections:
+#   "none"   - float32 vectors only
+#   "scalar" - int8 copies, about 4x less vector RAM
+#   "binary" - 1-bit copies, about 32x less; best with oversampling and rescore
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+VECTOR_QUANTILE = float(os.getenv("VECTOR_QUANTILE", "0.99"))
+# Keep the float32 originals on disk (mmap) and only the quantized copies in RAM
+VECTOR_ON_DISK = os.getenv("VECTOR_ON_DISK", "false").lower() in ("1", "true", "yes")
+# Query-time defaults for quantized collections: fetch limit * oversampling
+# candidates with the quantized vectors, then rescore them with the originals
+SEARCH_OVERSAMPLING = float(os.getenv("VECTOR_SEARCH_OVERSAMPLING", "2.0"))
+SEARCH_RESCORE = os.getenv("VECTOR_SEARCH_RESCORE", "true").lower() in ("1", "true", "yes")
+
+# Upsert batching
+UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "64"))
+UPSERT_PARALLEL = int(os.getenv("QDRANT_UPSERT_PARALLEL", "2"))
+UPSERT_MAX_RETRIES = int(os.getenv("QDRANT_UPSERT_MAX_RETRIES", "3"))
+UPSERT_BACKOFF_SECONDS = float(os.getenv("QDRANT_UPSERT_BACKOFF_SECONDS", "0.5"))
+
+
+def collection_for_user(user_id):
+    """Returns the collection holding a user's chunks under the current tenant mode."""
+    if VECTOR_TENANT_MODE == "sharded":
+        shard = zlib.crc32(user_id.encode("utf-8")) % VECTOR_SHARD_COUNT
+        return f"{COLLECTION_NAME}_shard_{shard}"
+    return COLLECTION_NAME
+
+
+def all_collections():
+    """Returns every collection name the current tenant mode can write to."""
+    if VECTOR_TENANT_MODE == "sharded":
+        return [f"{COLLECTION_NAME}_shard_{shard}" for shard in range(VECTOR_SHARD_COUNT)]
+    return [COLLECTION_NAME]
+
+
+def payload_index_schema():
+    """Returns the payload indexes every chunk collection should have."""
+    return {
+        USER_ID_FIELD: KeywordIndexParams(
+            type=KeywordIndexType.KEYWORD,
+            is_tenant=VECTOR_TENANT_MODE == "tenant"
+        ),
+        CONVERSATION_ID_FIELD: KeywordIndexParams(type=KeywordIndexType.KEYWORD)
+    }
+
+
+def quantization_config(quantization=None):
+    """Returns the Qdrant quantization config for the named mode, or None."""
+    quantization = (quantization or VECTOR_QUANTIZATION).lower()
+    if quantization == "none":
+        return None
+    if quantization == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=VECTOR_QUANTILE, always_ram=True)
+        )
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unsupported vector quantization: {quantization}")
+
+
+def vectors_config(vector_size, on_disk=None):
+    """Returns the vector parameters chunk collections are created with."""
+    return VectorParams(
+        size=vector_size,
+        distance=Distance.COSINE,
+        on_disk=VECTOR_ON_DISK if on_disk is None else on_disk
+    )
+
+
+def search_params(oversampling=None, rescore=None):
+    """
+    Returns quantization search parameters, or None when the collection is
+    not quantized and the caller did not ask for any.
+    """
+    if VECTOR_QUANTIZATION == "none" and oversampling is None and rescore is None:
+        return None
+    return SearchParams(
+        quantization=QuantizationSearchParams(
+            rescore=SEARCH_RESCORE if rescore is None else rescore,
+            oversampling=SEARCH_OVERSAMPLING if oversampling is None else oversampling
+        )
+    )
+
+
+class VectorStore(ABC):
+    """
+    Storage interface used by ingestion and search.
+
+    Points follow Qdrant's model (id, vector, payload); search results expose
+    id, score and payload.
+    """
+
+    @abstractmethod
+    def collection_exists(self, collection_name):
+        raise NotImplementedError
+
+    @abstractmethod
+    def ensure_collection(self, collection_name, vector_size):
+        raise NotImplementedError
+
+    @abstractmethod
+    def ensure_payload_indexes(self, collection_name):
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert(self, collection_name, points):
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, collection_name, query_vector, query_filter=None, limit=5,
+               oversampling=None, rescore=None):
+        raise NotImplementedError
+
+
+class QdrantVectorStore(VectorStore):
+    """
+    VectorStore backed by a Qdrant client.
+
+    Works the same against the remote server and Qdrant's embedded local
+    mode, since both expose the same client API.
+    """
+
+    def __init__(self, client, parallel_upserts=UPSERT_PARALLEL):
+        self.client = client
+        self._known_collections = set()
+        self._upsert_executor = ThreadPoolExecutor(
+            max_workers=max(1, parallel_upserts),
+            thread_name_prefix="qdrant-upsert"
+        )
+
+    def collection_exists(self, collection_name):
+        return self.client.collection_exists(collection_name)
+
+    def ensure_collection(self, collection_name, vector_size):
+        """
+        Creates the collection if it does not exist yet.
+
+        Collections seen once are remembered, so later uploads skip the check.
+        """
+        if collection_name in self._known_collections:
+            return
+        if not self.client.collection_exists(collection_name):
+            self.create_collection(collection_name, vector_size)
+        self.ensure_payload_indexes(collection_name)
+        self._known_collections.add(collection_name)
+
+    def create_collection(self, collection_name, vector_size):
+        """
+        Creates a chunk collection with the configured tenant layout,
+        quantization and on-disk storage.
+        """
+        hnsw_config = None
+        if VECTOR_TENANT_MODE == "tenant":
+            hnsw_config = HnswConfigDiff(payload_m=TENANT_PAYLOAD_M, m=0)
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=vectors_config(vector_size),
+            hnsw_config=hnsw_config,
+            quantization_config=quantization_config()
+        )
+        logger.info(
+            "Created Qdrant collection %s (quantization=%s, on_disk=%s).",
+            collection_name, VECTOR_QUANTIZATION, VECTOR_ON_DISK
+        )
+
+    def ensure_payload_indexes(self, collection_name):
+        """
+        Creates any missing payload indexes used by filtered search, and
+        recreates an index whose is_tenant flag no longer matches the tenant
+        mode (e.g. an existing collection switched to "tenant").
+
+        In tenant mode the collection is also switched to per-tenant HNSW
+        graphs, so a user's search only walks that user's points.
+        """
+        info = self.client.get_collection(collection_name)
+        existing = info.payload_schema or {}
+        for field_name, field_schema in payload_index_schema().items():
+            if field_name in existing:
+                current_params = existing[field_name].params
+                current_tenant = bool(getattr(current_params, "is_tenant", None))
+                if current_tenant == bool(field_schema.is_tenant):
+                    continue
+                # is_tenant cannot be updated in place; the index is rebuilt
+                # from the stored payloads, so no points need re-uploading
+                logger.warning(
+                    "Recreating payload index %s.%s to set is_tenant=%s.",
+                    collection_name, field_name, bool(field_schema.is_tenant)
+                )
+                self.client.delete_payload_index(
+                    collection_name=collection_name,
+                    field_name=field_name,
+                    wait=True
+                )
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+                wait=True
+            )
+            logger.info("Created payload index on %s.%s.", collection_name, field_name)
+
+        hnsw = info.config.hnsw_config
+        if VECTOR_TENANT_MODE == "tenant" and (hnsw.m != 0 or hnsw.payload_m != TENANT_PAYLOAD_M):
+            self.client.update_collection(
+                collection_name=collection_name,
+                hnsw_config=HnswConfigDiff(payload_m=TENANT_PAYLOAD_M, m=0)
+            )
+            logger.info("Switched %s to per-tenant HNSW graphs.", collection_name)
+
+    def _upsert_with_retry(self, collection_name, points, max_retries):
+        attempt = 0
+        while True:
+            try:
+                self.client.upsert(collection_name=collection_name, points=points, wait=True)
+                return len(points)
+            except Exception as e:
+                attempt += 1
+                if attempt > max_retries:
+                    raise
+                delay = UPSERT_BACKOFF_SECONDS * (2 ** (attempt - 1))
+                delay += random.uniform(0, delay)
+                logger.warning(
+                    "Upsert of %d points failed (attempt %d/%d): %s; retrying in %.2fs.",
+                    len(points), attempt, max_retries, str(e), delay
+                )
+                time.sleep(delay)
+
+    def upsert(self, collection_name, points, batch_size=None, max_retries=None):
+        """
+        Upserts points in batches, with several batches in flight at once.
+
+        Each batch is retried with exponential backoff and jitter.
+
+        Returns:
+            int: Number of points written
+        """
+        batch_size = batch_size or UPSERT_BATCH_SIZE
+        max_retries = UPSERT_MAX_RETRIES if max_retries is None else max_retries
+        batches = [points[start:start + batch_size] for start in range(0, len(points), batch_size)]
+        if len(batches) <= 1:
+            return sum(self._upsert_with_retry(collection_name, batch, max_retries) for batch in batches)
+
+        futures = [
+            self._upsert_executor.submit(self._upsert_with_retry, collection_name, batch, max_retries)
+            for batch in batches
+        ]
+        return sum(future.result() for future in futures)
+
+    def search(self, collection_name, query_vector, query_filter=None, limit=5,
+               oversampling=None, rescore=None):
+        """
+        Searches a collection. On quantized collections, oversampling and
+        rescore (defaults VECTOR_SEARCH_OVERSAMPLING / VECTOR_SEARCH_RESCORE)
+        trade latency for recall.
+        """
+        return self.client.search(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            query_filter=query_filter,
+            limit=limit,
+            search_params=search_params(oversampling, rescore)
+        )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_vector_store(backend=VECTOR_STORE_BACKEND):
+    """Builds a VectorStore for the named backend."""
+    if backend == "remote":
+        return QdrantVectorStore(get_qdrant_client())
+    if backend == "local":
+        # Embedded mode serializes writes itself; parallel upserts gain nothing
+        return QdrantVectorStore(get_local_qdrant_client(QDRANT_LOCAL_PATH), parallel_upserts=1)
+    if backend == "memory":
+        return QdrantVectorStore(get_local_qdrant_client(":memory:"), parallel_upserts=1)
+    raise ValueError(f"Unsupported vector store backend: {backend}")
+
+
+def init_collections():
+    """
+    Ensures payload indexes on every existing chunk collection.
+
+    Called at startup; collections created later get their indexes when
+    ensure_collection first creates them.
+    """
+    vector_store = get_vector_store()
+    for collection_name in all_collections():
+        if vector_store.collection_exists(collection_name):
+            vector_store.ensure_payload_indexes(collection_name)
+
+
+def get_vector_store():
+    """Returns the process-wide VectorStore selected by VECTOR_STORE_BACKEND."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_vector_store()
+                logger.info("Vector store backend: %s.", VECTOR_STORE_BACKEND)
+    return _store
@@ -1,8 +1,12 @@
 import os
 import json
+import time
+import random
 import logging
+import threading
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 
 # Load environment variables
 load_dotenv()
@@ -68,6 +72,17 @@ Guidelines for responses:
 Your responses must be entirely focused on the user's query, and all information provided should be 100% relevant. Avoid adding unrelated details or off-topic information. Always ensure the highest quality and accuracy in your responses by utilizing your access to external knowledge.
 """
 
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an AI assistant about the user's documents.
+Update the existing summary with the new turns below. Keep facts, names, numbers and open questions the user may refer back to; drop pleasantries and repetition. Keep the summary under 250 words.
+Respond in JSON as {{"summary": "..."}}.
+
+Existing summary:
+{previous_summary}
+
+New turns:
+{turns}
+"""
+
 # Model configuration
 generation_config = {
     "temperature": 0.3,
@@ -77,6 +92,53 @@ generation_config = {
     "response_mime_type": "application/json",
 }
 
+# Request limits shared by every caller in this process
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "30"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_SECONDS = float(os.getenv("GEMINI_BACKOFF_SECONDS", "1.0"))
+
+# 429 and 5xx responses are worth retrying; anything else fails immediately
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+)
+
+_request_slots = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+
+# Process-wide token usage, as reported by the API
+_usage_lock = threading.Lock()
+_usage_totals = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+
+def _record_usage(response):
+    """Logs the prompt/output token counts of one request and adds them to the totals."""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return None
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    with _usage_lock:
+        _usage_totals["requests"] += 1
+        _usage_totals["prompt_tokens"] += prompt_tokens
+        _usage_totals["output_tokens"] += output_tokens
+    logger.info("Gemini usage: %d prompt tokens, %d output tokens.", prompt_tokens, output_tokens)
+    return {"prompt_tokens": prompt_tokens, "output_tokens": output_tokens}
+
+
+def usage_stats():
+    """Returns token totals and the average prompt size since startup."""
+    with _usage_lock:
+        stats = dict(_usage_totals)
+    stats["avg_prompt_tokens"] = round(stats["prompt_tokens"] / stats["requests"], 1) if stats["requests"] else 0.0
+    return stats
+
 class Gemini:
     def __init__(self):
         logger.info("Initializing the Gemini class.")
@@ -90,13 +152,107 @@ class Gemini:
             logger.error("Error initializing the Gemini model: %s", str(e))
             raise ValueError(f"Initialization error: {e}")
 
-    def respond(self, retrieved_contents: str = None, user_input: str = None, history: str = None) -> str:
-        logger.info("Respond method called with user_input: %s", user_input)
+    def _generate(self, inputs, **kwargs):
+        """
+        Calls generate_content under the process-wide concurrency limit.
+
+        Retryable failures (429/5xx/timeouts) are retried with full-jitter
+        exponential backoff; the concurrency slot is released while waiting.
+        """
+        attempt = 0
+        while True:
+            if not _request_slots.acquire(timeout=GEMINI_QUEUE_TIMEOUT):
+                raise ValueError("Too many concurrent Gemini requests; try again later.")
+            try:
+                return self.model.generate_content(
+                    inputs,
+                    request_options={"timeout": GEMINI_TIMEOUT},
+                    **kwargs
+                )
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                if attempt > GEMINI_MAX_RETRIES:
+                    raise
+                delay = random.uniform(0, GEMINI_BACKOFF_SECONDS * (2 ** attempt))
+                logger.warning(
+                    "Gemini request failed (attempt %d/%d): %s; retrying in %.2fs.",
+                    attempt, GEMINI_MAX_RETRIES, str(e), delay
+                )
+            finally:
+                _request_slots.release()
+            time.sleep(delay)
+
+    def _generate_stream(self, inputs):
+        """
+        Streams generate_content text fragments under the concurrency limit.
+
+        The slot is held until the stream is exhausted or closed. Retryable
+        failures are retried only before the first fragment has been yielded.
+        """
+        attempt = 0
+        while True:
+            if not _request_slots.acquire(timeout=GEMINI_QUEUE_TIMEOUT):
+                raise ValueError("Too many concurrent Gemini requests; try again later.")
+            yielded = False
+            try:
+                response = self.model.generate_content(
+                    inputs,
+                    stream=True,
+                    request_options={"timeout": GEMINI_TIMEOUT}
+                )
+                for chunk in response:
+                    text = chunk.text
+                    if text:
+                        yielded = True
+                        yield text
+                _record_usage(response)
+                return
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                if yielded or attempt > GEMINI_MAX_RETRIES:
+                    raise
+                delay = random.uniform(0, GEMINI_BACKOFF_SECONDS * (2 ** attempt))
+                logger.warning(
+                    "Gemini stream failed (attempt %d/%d): %s; retrying in %.2fs.",
+                    attempt, GEMINI_MAX_RETRIES, str(e), delay
+                )
+            finally:
+                _request_slots.release()
+            time.sleep(delay)
+
+    @staticmethod
+    def build_prompt(retrieved_contents: str = None, user_input: str = None, history: str = None) -> str:
         if not user_input:
             logger.warning("No user_input provided to respond method.")
             raise ValueError("User input is required.")
+        history_block = f"\n\nConversation so far:\n{history}\n\nUser input: " if history else ""
+        return BASE_PROMPT + (retrieved_contents or "") + history_block + user_input
+
+    @staticmethod
+    def parse_response(text: str):
+        """Parses the model's JSON answer."""
+        return json.loads(text)
 
-        PROMPT = BASE_PROMPT + (retrieved_contents or "") + user_input
+    def respond_stream(self, retrieved_contents: str = None, user_input: str = None, history: str = None):
+        """
+        Yields the raw response text as the model generates it.
+
+        The concatenated fragments form the same JSON document respond()
+        returns; pass it to parse_response once the stream ends.
+        """
+        logger.info("Respond stream called with user_input: %s", user_input)
+        PROMPT = self.build_prompt(retrieved_contents, user_input, history)
+        logger.debug("Constructed prompt: %s", PROMPT)
+
+        try:
+            yield from self._generate_stream([PROMPT])
+        except Exception as e:
+            logger.error("Error streaming response: %s", str(e))
+            raise ValueError(f"Error generating response: {e}")
+
+    def respond(self, retrieved_contents: str = None, user_input: str = None, history: str = None) -> str:
+        logger.info("Respond method called with user_input: %s", user_input)
+        PROMPT = self.build_prompt(retrieved_contents, user_input, history)
         logger.debug("Constructed prompt: %s", PROMPT)
 
         inputs = [PROMPT]
@@ -104,8 +260,9 @@ class Gemini:
         try:
             # Generate content using the model
             logger.info("Sending input to the generative model.")
-            response = self.model.generate_content(inputs)
+            response = self._generate(inputs)
             logger.info("Response received from the model.")
+            _record_usage(response)
             
             # Log the entire raw response for debugging
             logger.debug("Raw model response: %s", response)
@@ -113,14 +270,49 @@ class Gemini:
             # Parse the response
             if response and hasattr(response, 'text'):
                 logger.info("Parsing the response text.")
-                return json.loads(response.text)
+                return self.parse_response(response.text)
             else:
                 logger.error("No valid response received from the model.")
                 raise ValueError("No valid response received from the model.")
         except Exception as e:
             logger.error("Error generating response: %s", str(e))
             raise ValueError(f"Error generating response: {e}")
-       
+
+
+    def summarize(self, previous_summary: str = None, turns: str = None) -> str:
+        """
+        Folds conversation turns into a running summary.
+
+        Returns:
+            str: The updated summary
+        """
+        logger.info("Summarize method called.")
+        PROMPT = SUMMARY_PROMPT.format(
+            previous_summary=previous_summary or "(none)",
+            turns=turns or ""
+        )
+        try:
+            response = self._generate([PROMPT])
+            _record_usage(response)
+            return self.parse_response(response.text).get("summary", "")
+        except Exception as e:
+            logger.error("Error summarizing conversation: %s", str(e))
+            raise ValueError(f"Error summarizing conversation: {e}")
+
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_gemini():
+    """Returns the process-wide Gemini instance, creating it on first use."""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = Gemini()
+    return _instance
+
 
 #     def app_prompt(self, retrieved_contents: str, user_input: str = None, history: str = None) -> str:
 #         """
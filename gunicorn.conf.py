@@ -0,0 +1,14 @@
+import os
+
+wsgi_app = "app2:app"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+
+def post_fork(server, worker):
+    """Runs app startup (model warmup, collection init) in each worker before it accepts requests."""
+    from app2 import startup
+    from model_config.embed_model import embedding_model_stats
+
+    startup()
+    server.log.info("Worker %s embedding model ready: %s", worker.pid, embedding_model_stats())
@@ -0,0 +1,272 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from config.db import db
+from conversation_history import build_history
+from db.conversations_db import add_query, build_query_data, get_conversation_header
+from response_cache import cached_respond
+from sample_vectordb import file_vectorizing
+import search_query
+
+logger = logging.getLogger(__name__)
+
+# Background ingestion settings
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+PROGRESS_WRITE_INTERVAL = float(os.getenv("JOB_PROGRESS_WRITE_INTERVAL", "1.0"))
+# How long a query waits for its conversation's pending ingestion before
+# searching without it (this blocks a request thread, so keep it short),
+# and how often other processes' job records are re-read meanwhile
+INGESTION_WAIT_TIMEOUT = float(os.getenv("INGESTION_WAIT_TIMEOUT", "15"))
+INGESTION_POLL_INTERVAL = float(os.getenv("INGESTION_POLL_INTERVAL", "0.5"))
+# A queued/running job whose record has not been updated for this long is
+# treated as dead (worker killed mid-ingestion) rather than pending
+INGESTION_JOB_LEASE_SECONDS = float(os.getenv("INGESTION_JOB_LEASE_SECONDS", "300"))
+
+INGESTION_STAGES = ["load", "split", "embed", "upsert"]
+RESPOND_STAGE = "respond"
+
+# Firestore jobs collection reference (the persistent job table)
+jobs_collection = db.collection('jobs')
+
+_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingestion")
+
+# conversation_id -> futures of ingestion jobs still running in this process.
+# Jobs in other processes are found through their job records (see pending_ingestions).
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _initial_stages(with_response):
+    stages = {stage: {"status": "pending", "done": 0, "total": None} for stage in INGESTION_STAGES}
+    if with_response:
+        stages[RESPOND_STAGE] = {"status": "pending", "done": 0, "total": 1}
+    return stages
+
+
+def get_job(job_id):
+    """
+    Returns a job record by ID, or None if it does not exist.
+    """
+    doc = jobs_collection.document(job_id).get()
+    if not doc.exists:
+        return None
+    job = doc.to_dict()
+    job["job_id"] = doc.id
+    return job
+
+
+def submit_ingestion(user_id, conversation_id, file_path, query_text=None, search_scope=None,
+                     use_cache=True):
+    """
+    Records an ingestion job and hands it to the background pool.
+
+    When query_text is given, the job answers it once the file's vectors are
+    stored and appends the turn to the conversation. search_scope is the
+    conversation_ids argument for that search (None searches all of the
+    user's documents); use_cache=False bypasses the response cache.
+
+    Returns:
+        str: The job ID
+    """
+    job_id = str(uuid.uuid4())
+    jobs_collection.document(job_id).set({
+        "user_id": user_id,
+        "conversation_id": conversation_id,
+        "file_path": file_path,
+        "query_text": query_text,
+        "search_scope": search_scope,
+        "use_cache": use_cache,
+        "status": "queued",
+        "stages": _initial_stages(bool(query_text)),
+        "result": None,
+        "error": None,
+        "created_at": _now(),
+        "updated_at": _now()
+    })
+    _schedule(job_id, user_id, conversation_id, file_path, query_text, search_scope, use_cache)
+    logger.info("Queued ingestion job %s for conversation %s.", job_id, conversation_id)
+    return job_id
+
+
+def _schedule(job_id, user_id, conversation_id, file_path, query_text, search_scope, use_cache=True):
+    future = _executor.submit(
+        _run_job, job_id, user_id, conversation_id, file_path, query_text, search_scope, use_cache
+    )
+    with _pending_lock:
+        _pending.setdefault(conversation_id, set()).add(future)
+
+    def _done(f):
+        with _pending_lock:
+            futures = _pending.get(conversation_id)
+            if futures:
+                futures.discard(f)
+                if not futures:
+                    del _pending[conversation_id]
+
+    future.add_done_callback(_done)
+    return future
+
+
+def pending_ingestions(conversation_id):
+    """
+    Returns how many ingestion jobs for the conversation are unfinished in any process.
+
+    Only queued/running jobs whose record was updated within
+    INGESTION_JOB_LEASE_SECONDS count; running jobs refresh updated_at with
+    every progress write, so a job whose worker died stops counting once
+    its lease runs out instead of blocking queries forever.
+    """
+    lease_start = _now() - timedelta(seconds=INGESTION_JOB_LEASE_SECONDS)
+    jobs = (
+        jobs_collection
+        .where("conversation_id", "==", conversation_id)
+        .where("status", "in", ["queued", "running"])
+        .select(["updated_at"])
+        .stream()
+    )
+    return sum(1 for job in jobs if (job.to_dict().get("updated_at") or lease_start) > lease_start)
+
+
+def has_pending_ingestion(conversation_id):
+    """Returns True while a file for this conversation is still being ingested."""
+    with _pending_lock:
+        if _pending.get(conversation_id):
+            return True
+    return pending_ingestions(conversation_id) > 0
+
+
+def wait_for_conversation(conversation_id, timeout=None):
+    """
+    Blocks until every ingestion job for the conversation finishes.
+
+    Jobs running in this process are awaited directly; jobs in other
+    processes are awaited by polling their job records. Gives up after
+    INGESTION_WAIT_TIMEOUT so a slow upload delays a query, not a request
+    thread indefinitely.
+    """
+    timeout = INGESTION_WAIT_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    with _pending_lock:
+        futures = list(_pending.get(conversation_id, ()))
+    for future in futures:
+        try:
+            future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:
+            logger.warning("Ingestion job for conversation %s failed: %s", conversation_id, str(e))
+
+    while pending_ingestions(conversation_id) > 0:
+        if time.monotonic() >= deadline:
+            logger.warning(
+                "Ingestion for conversation %s still pending after %.0fs; searching without it.",
+                conversation_id, timeout
+            )
+            return False
+        time.sleep(INGESTION_POLL_INTERVAL)
+    return True
+
+
+class _JobProgress:
+    """Writes per-stage progress to the job record, throttled per stage."""
+
+    def __init__(self, job_id):
+        self.job_ref = jobs_collection.document(job_id)
+        self._last_write = {}
+
+    def update(self, stage, done, total, status=None):
+        status = status or ("completed" if total is not None and done >= total else "running")
+        now = time.monotonic()
+        if status == "running" and now - self._last_write.get(stage, 0) < PROGRESS_WRITE_INTERVAL:
+            return
+        self._last_write[stage] = now
+        self.job_ref.update({
+            f"stages.{stage}": {"status": status, "done": done, "total": total},
+            "updated_at": _now()
+        })
+
+    def set_status(self, status, **fields):
+        fields.update({"status": status, "updated_at": _now()})
+        self.job_ref.update(fields)
+
+
+def _run_job(job_id, user_id, conversation_id, file_path, query_text, search_scope, use_cache=True):
+    progress = _JobProgress(job_id)
+    progress.set_status("running", started_at=_now())
+    try:
+        vectordb_response = file_vectorizing(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            file_path=file_path,
+            progress_callback=progress.update
+        )
+        logger.info("Vectorization completed for job %s: %s", job_id, file_path)
+
+        result = {
+            "collection_name": vectordb_response["collection_name"],
+            "embedding_stats": vectordb_response["embedding_stats"]
+        }
+
+        gemini_response = None
+        if query_text:
+            progress.update(RESPOND_STAGE, 0, 1)
+            chunks = search_query.search_user_chunks(
+                query=query_text,
+                user_id=user_id,
+                conversation_ids=search_scope
+            )
+            conversation_data = get_conversation_header(conversation_id)
+            history = build_history(conversation_id, conversation_data) if conversation_data else None
+            gemini_response = cached_respond(chunks, query_text, use_cache, history)
+            progress.update(RESPOND_STAGE, 1, 1)
+
+        query_data = build_query_data(query_text, file_path, gemini_response)
+        result["query_id"] = add_query(conversation_id, query_data)
+        result["response"] = gemini_response
+
+        progress.set_status("completed", result=result, finished_at=_now())
+        logger.info("Ingestion job %s completed.", job_id)
+        return result
+    except Exception as e:
+        logger.error("Ingestion job %s failed: %s", job_id, str(e))
+        progress.set_status("failed", error=str(e), finished_at=_now())
+        raise
+
+
+def resume_unfinished_jobs():
+    """
+    Re-queues jobs left queued or running by a previous process.
+
+    Uploaded files are kept on disk, so an interrupted job is rerun from the
+    start; chunk point IDs are deterministic, so the rerun overwrites any
+    vectors the interrupted run already stored.
+    """
+    resumed = 0
+    for doc in jobs_collection.where("status", "in", ["queued", "running"]).stream():
+        job = doc.to_dict()
+        if not job.get("file_path") or not os.path.exists(job["file_path"]):
+            jobs_collection.document(doc.id).update({
+                "status": "failed",
+                "error": "Uploaded file is no longer available",
+                "updated_at": _now()
+            })
+            continue
+        jobs_collection.document(doc.id).update({
+            "status": "queued",
+            "stages": _initial_stages(bool(job.get("query_text"))),
+            "updated_at": _now()
+        })
+        _schedule(
+            doc.id, job["user_id"], job["conversation_id"], job["file_path"],
+            job.get("query_text"), job.get("search_scope"), job.get("use_cache", True)
+        )
+        resumed += 1
+    if resumed:
+        logger.info("Resumed %d unfinished ingestion jobs.", resumed)
+    return resumed
@@ -1,12 +1,161 @@
+import os
+import time
+import logging
+import resource
+import threading
 from langchain.embeddings import HuggingFaceBgeEmbeddings
 
-def model_embedding():
-    model_name = "BAAI/bge-large-en"
-    model_kwargs = {'device': 'cpu'}
-    encode_kwargs = {'normalize_embeddings': False}
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "BAAI/bge-large-en"
+MODEL_KWARGS = {'device': 'cpu'}
+ENCODE_KWARGS = {'normalize_embeddings': False}
+
+# Inference backend: "torch" (fp32 PyTorch), "int8" (PyTorch with dynamic int8
+# quantization of the Linear layers) or "onnx" (ONNX Runtime through
+# sentence-transformers; needs sentence-transformers>=3.2 and optimum[onnxruntime])
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# Optional ONNX file inside the model repo, e.g. "onnx/model_qint8_avx512.onnx"
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
+
+
+def model_cache_id(backend=None):
+    """
+    Identifies the model and backend in embedding cache keys.
+
+    Backends produce slightly different vectors, so each gets its own cache
+    entries; fp32 keeps the bare model name so existing entries stay valid.
+    ONNX exports (EMBEDDING_ONNX_FILE) differ from each other too, e.g. fp32
+    vs a quantized file, so the file name is part of the ID.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "torch":
+        return MODEL_NAME
+    if backend == "onnx" and EMBEDDING_ONNX_FILE:
+        return f"{MODEL_NAME}:{backend}:{EMBEDDING_ONNX_FILE}"
+    return f"{MODEL_NAME}:{backend}"
+
+
+MODEL_CACHE_ID = model_cache_id()
+
+# Process-wide registry: one loaded model per (model_name, device, normalize, backend) key
+_registry = {}
+_registry_stats = {}
+_registry_lock = threading.Lock()
+
+
+def _registry_key(model_name, model_kwargs, encode_kwargs, backend):
+    return (
+        model_name,
+        model_kwargs.get('device', 'cpu'),
+        bool(encode_kwargs.get('normalize_embeddings', False)),
+        backend
+    )
+
+
+def _load_model(model_name, model_kwargs, encode_kwargs, backend):
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported EMBEDDING_BACKEND: {backend}")
+
+    if backend == "onnx":
+        model_kwargs = dict(model_kwargs, backend="onnx")
+        if EMBEDDING_ONNX_FILE:
+            model_kwargs["model_kwargs"] = {"file_name": EMBEDDING_ONNX_FILE}
+
     embeddings = HuggingFaceBgeEmbeddings(
         model_name=model_name,
         model_kwargs=model_kwargs,
         encode_kwargs=encode_kwargs
     )
-    return embeddings
\ No newline at end of file
+
+    if backend == "int8":
+        import torch
+        # Weights of the Linear layers become int8; activations are quantized per batch
+        torch.quantization.quantize_dynamic(
+            embeddings.client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    return embeddings
+
+
+def _rss_mb():
+    """Returns the current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is the peak (not current) RSS, in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_embedding_model(model_name=MODEL_NAME, model_kwargs=None, encode_kwargs=None, backend=None):
+    """
+    Returns the process-wide embedding model, loading it on first use.
+
+    The model is loaded at most once per process and shared by every thread;
+    concurrent first callers block on the registry lock until the load finishes.
+    backend defaults to EMBEDDING_BACKEND.
+    """
+    model_kwargs = model_kwargs or MODEL_KWARGS
+    encode_kwargs = encode_kwargs or ENCODE_KWARGS
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    key = _registry_key(model_name, model_kwargs, encode_kwargs, backend)
+
+    embeddings = _registry.get(key)
+    if embeddings is not None:
+        return embeddings
+
+    with _registry_lock:
+        embeddings = _registry.get(key)
+        if embeddings is not None:
+            return embeddings
+
+        logger.info("Loading embedding model %s on %s (%s backend).", model_name, key[1], backend)
+        rss_before = _rss_mb()
+        started = time.perf_counter()
+        embeddings = _load_model(model_name, model_kwargs, encode_kwargs, backend)
+        load_seconds = time.perf_counter() - started
+        rss_after = _rss_mb()
+
+        _registry[key] = embeddings
+        _registry_stats[key] = {
+            "model_name": model_name,
+            "device": key[1],
+            "normalize_embeddings": key[2],
+            "backend": backend,
+            "load_seconds": round(load_seconds, 3),
+            "rss_before_mb": round(rss_before, 1),
+            "rss_after_mb": round(rss_after, 1),
+            "rss_delta_mb": round(rss_after - rss_before, 1),
+            "loaded_at": time.time()
+        }
+        logger.info(
+            "Embedding model %s loaded in %.2fs (RSS %.1f MB -> %.1f MB).",
+            model_name, load_seconds, rss_before, rss_after
+        )
+        return embeddings
+
+
+def warmup_embedding_model():
+    """
+    Loads the default embedding model and runs one query through it.
+
+    Call this at startup (module import of the Flask app, or gunicorn's
+    post_fork hook) so the first user request does not pay the load cost.
+    """
+    embeddings = get_embedding_model()
+    started = time.perf_counter()
+    embeddings.embed_query("warmup")
+    logger.info("Embedding model warmup query took %.3fs.", time.perf_counter() - started)
+    return embedding_model_stats()
+
+
+def embedding_model_stats():
+    """Returns load time and memory figures for every model in the registry."""
+    return [dict(stats) for stats in _registry_stats.values()]
+
+
+def model_embedding():
+    """Returns the shared BGE embedding model (kept for existing callers)."""
+    return get_embedding_model()
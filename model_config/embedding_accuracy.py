@@ -0,0 +1,140 @@
+"""
+Compares an alternative embedding backend against the fp32 model on a sample corpus.
+
+Usage:
+    python -m model_config.embedding_accuracy --corpus DIR_OR_FILE [--backend int8]
+        [--queries FILE] [--k 10] [--sample-queries 200] [--min-recall 0.95]
+
+The corpus (.txt/.md files) is chunked like ingestion does. Each query's
+top-k chunks under the candidate backend are compared with its top-k under
+fp32 (recall@k), and both backends' corpus throughput is timed. Queries come
+from --queries (one per line) or, failing that, from the opening words of
+sampled chunks. Exits with status 1 when recall@k is below --min-recall.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from model_config.embed_model import EMBEDDING_BACKENDS, get_embedding_model
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CORPUS_EXTENSIONS = (".txt", ".md")
+
+
+def load_corpus(path):
+    """Reads text files under path and splits them into ingestion-sized chunks."""
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+            if name.lower().endswith(CORPUS_EXTENSIONS)
+        )
+    else:
+        files = [path]
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    chunks = []
+    for file_path in files:
+        with open(file_path, encoding="utf-8", errors="ignore") as handle:
+            chunks.extend(chunk for chunk in splitter.split_text(handle.read()) if chunk.strip())
+    return chunks
+
+
+def sample_queries(chunks, count, seed=0, words=12):
+    """Uses the opening words of randomly chosen chunks as queries."""
+    rng = random.Random(seed)
+    picked = rng.sample(chunks, min(count, len(chunks)))
+    return [" ".join(chunk.split()[:words]) for chunk in picked]
+
+
+def encode(backend, texts, batch_size, query_instruction=False):
+    """Returns L2-normalized embeddings and the seconds spent encoding."""
+    embeddings = get_embedding_model(backend=backend)
+    if query_instruction:
+        texts = [embeddings.query_instruction + text for text in texts]
+    started = time.perf_counter()
+    vectors = embeddings.client.encode(
+        texts, batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True
+    )
+    return np.asarray(vectors, dtype=np.float32), time.perf_counter() - started
+
+
+def top_k(query_vectors, corpus_vectors, k):
+    scores = query_vectors @ corpus_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def evaluate(corpus, queries, backend, k=10, batch_size=32):
+    """
+    Returns recall@k of backend against fp32, plus throughput for both.
+    """
+    results = {}
+    neighbours = {}
+    corpus_vectors = {}
+    for name in ("torch", backend):
+        # One untimed pass so model load and lazy initialization are not measured
+        encode(name, corpus[:batch_size], batch_size)
+        vectors, seconds = encode(name, corpus, batch_size)
+        query_vectors, _ = encode(name, queries, batch_size, query_instruction=True)
+        corpus_vectors[name] = vectors
+        neighbours[name] = top_k(query_vectors, vectors, k)
+        results[name] = {
+            "corpus_seconds": round(seconds, 3),
+            "chunks_per_second": round(len(corpus) / seconds, 2) if seconds > 0 else 0.0
+        }
+
+    overlaps = [
+        len(set(reference) & set(candidate)) / k
+        for reference, candidate in zip(neighbours["torch"], neighbours[backend])
+    ]
+    # Cosine between each chunk's fp32 and candidate vectors (both normalized)
+    agreement = np.sum(corpus_vectors["torch"] * corpus_vectors[backend], axis=1)
+
+    return {
+        "backend": backend,
+        "chunks": len(corpus),
+        "queries": len(queries),
+        "k": k,
+        f"recall_at_{k}": round(float(np.mean(overlaps)), 4),
+        "min_query_recall": round(float(np.min(overlaps)), 4),
+        "mean_vector_cosine": round(float(np.mean(agreement)), 5),
+        "speedup": round(results["torch"]["corpus_seconds"] / results[backend]["corpus_seconds"], 2)
+        if results[backend]["corpus_seconds"] > 0 else None,
+        "fp32": results["torch"],
+        "candidate": results[backend]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check an embedding backend's recall@k against fp32.")
+    parser.add_argument("--corpus", required=True, help="Text file or directory of .txt/.md files")
+    parser.add_argument("--backend", default="int8", choices=[b for b in EMBEDDING_BACKENDS if b != "torch"])
+    parser.add_argument("--queries", help="File with one query per line")
+    parser.add_argument("--sample-queries", type=int, default=200, help="Queries drawn from the corpus when --queries is not given")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--min-recall", type=float, default=0.95, help="Fail below this recall@k")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if len(corpus) <= args.k:
+        parser.error(f"Corpus has {len(corpus)} chunks; need more than k={args.k}.")
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as handle:
+            queries = [line.strip() for line in handle if line.strip()]
+    else:
+        queries = sample_queries(corpus, args.sample_queries)
+
+    report = evaluate(corpus, queries, args.backend, k=args.k, batch_size=args.batch_size)
+    print(json.dumps(report, indent=2))
+    if report[f"recall_at_{args.k}"] < args.min_recall:
+        logger.error("recall@%d %.4f is below %.4f.", args.k, report[f"recall_at_{args.k}"], args.min_recall)
+        sys.exit(1)
@@ -0,0 +1,177 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join("cache", "embeddings.sqlite3"))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))
+
+# Entries are touched in memory and flushed in bulk to keep reads cheap
+_TOUCH_FLUSH_SIZE = 1000
+# The entry count is tracked in memory; it is recounted from the table at
+# most this often, to pick up writes and evictions by other processes
+_RECOUNT_INTERVAL = 60.0
+
+
+def chunk_key(model_name, normalize, text):
+    """Returns the content address for a chunk embedded by a given model."""
+    digest = hashlib.sha256()
+    digest.update(f"{model_name}\0{int(bool(normalize))}\0".encode("utf-8"))
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk store of chunk embeddings.
+
+    Vectors are stored as float32 blobs in SQLite, keyed by
+    (model name, normalization flag, chunk text hash). When the cache grows
+    past max_entries, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=EMBED_CACHE_PATH, max_entries=EMBED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+        self._recount()
+
+    def _recount(self):
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._counted_at = time.monotonic()
+
+    def get_many(self, keys):
+        """Returns a dict of key -> vector for the keys present in the cache."""
+        found = {}
+        if not keys:
+            return found
+
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            now = time.time()
+            for key in found:
+                self._touched[key] = now
+            if len(self._touched) >= _TOUCH_FLUSH_SIZE:
+                self._flush_touched()
+
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        """Stores (key, vector) pairs and evicts old entries if over capacity."""
+        if not items:
+            return
+
+        now = time.time()
+        rows = [
+            (key, len(vector), array("f", vector).tobytes(), now)
+            for key, vector in items
+        ]
+        with self._lock:
+            # Keys are content addresses, so an existing row already holds this vector
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, dim, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            ).rowcount
+            self._entries += max(0, inserted)
+            self._flush_touched()
+            self._evict()
+            self._conn.commit()
+
+    def _flush_touched(self):
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE key = ?",
+            [(last_access, key) for key, last_access in self._touched.items()]
+        )
+        self._conn.commit()
+        self._touched.clear()
+
+    def _evict(self):
+        if self._entries > self.max_entries or time.monotonic() - self._counted_at > _RECOUNT_INTERVAL:
+            self._recount()
+        excess = self._entries - self.max_entries
+        if excess <= 0:
+            return
+        self._entries -= self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (excess,)
+        ).rowcount
+        logger.info("Evicted %d entries from the embedding cache.", excess)
+
+    def stats(self):
+        """
+        Returns hit/miss counters, hit rate and the number of stored entries.
+
+        Read from in-memory counters, so it is cheap enough to call per
+        request; entries may lag writes by other processes by up to
+        _RECOUNT_INTERVAL.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": self._entries,
+                "max_entries": self.max_entries,
+                "path": self.path
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Returns the process-wide embedding cache, or None when disabled."""
+    global _cache
+    if not EMBED_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
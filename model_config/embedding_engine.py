@@ -0,0 +1,132 @@
+import os
+import time
+import logging
+import threading
+from model_config.embed_model import MODEL_CACHE_ID, ENCODE_KWARGS, get_embedding_model
+from model_config.embedding_cache import chunk_key, get_embedding_cache
+
+logger = logging.getLogger(__name__)
+
+# Ingestion embedding settings, overridable per deployment
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_NUM_THREADS = int(os.getenv("EMBED_NUM_THREADS", "0"))  # 0 keeps torch's default
+
+_threads_lock = threading.Lock()
+_configured_threads = None
+
+
+def configure_threads(num_threads=None):
+    """
+    Sets torch's intra-op thread count for embedding inference.
+
+    The setting is process-wide, so it is only applied when it changes.
+    """
+    global _configured_threads
+    num_threads = EMBED_NUM_THREADS if num_threads is None else num_threads
+    if not num_threads or num_threads == _configured_threads:
+        return _configured_threads
+
+    with _threads_lock:
+        if num_threads != _configured_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+            _configured_threads = num_threads
+            logger.info("Embedding intra-op threads set to %d.", num_threads)
+    return _configured_threads
+
+
+class EmbeddingProgress:
+    """Tracks how many chunks have been embedded and the running throughput."""
+
+    def __init__(self, total, callback=None):
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def chunks_per_second(self):
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def advance(self, count):
+        self.done += count
+        logger.info(
+            "Embedded %d/%d chunks (%.1f chunks/s).",
+            self.done, self.total, self.chunks_per_second
+        )
+        if self.callback:
+            self.callback(self.done, self.total, self.chunks_per_second)
+
+    def summary(self):
+        return {
+            "chunks": self.done,
+            "seconds": round(self.elapsed, 3),
+            "chunks_per_second": round(self.chunks_per_second, 2)
+        }
+
+
+def embed_documents(texts, batch_size=None, num_threads=None, progress_callback=None, use_cache=True):
+    """
+    Embeds document chunks in fixed-size batches.
+
+    Chunks already in the embedding cache are served from disk; only the
+    misses reach the model. Misses are sorted by length before batching so
+    each batch pads to a similar sequence length; the vectors are returned
+    in the input order.
+
+    Args:
+        texts (list[str]): Chunk texts to embed
+        batch_size (int): Chunks per forward pass (defaults to EMBED_BATCH_SIZE)
+        num_threads (int): Intra-op thread count (defaults to EMBED_NUM_THREADS)
+        progress_callback (callable): Called as (done, total, chunks_per_second)
+        use_cache (bool): Read and write the on-disk embedding cache
+
+    Returns:
+        tuple: (list of vectors, throughput summary dict)
+    """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    vectors = [None] * len(texts)
+    progress = EmbeddingProgress(len(texts), progress_callback)
+
+    cache = get_embedding_cache() if use_cache else None
+    keys = None
+    if cache is not None:
+        normalize = ENCODE_KWARGS.get("normalize_embeddings", False)
+        keys = [chunk_key(MODEL_CACHE_ID, normalize, text) for text in texts]
+        cached = cache.get_many(keys)
+        for i, key in enumerate(keys):
+            if key in cached:
+                vectors[i] = cached[key]
+        if cached:
+            progress.advance(sum(1 for vector in vectors if vector is not None))
+
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        configure_threads(num_threads)
+        embeddings = get_embedding_model()
+        instruction = getattr(embeddings, "embed_instruction", "")
+        encode_kwargs = dict(embeddings.encode_kwargs)
+        encode_kwargs.pop("batch_size", None)
+
+        order = sorted(missing, key=lambda i: len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            batch_ids = order[start:start + batch_size]
+            batch = [instruction + texts[i].replace("\n", " ") for i in batch_ids]
+            batch_vectors = embeddings.client.encode(batch, batch_size=batch_size, **encode_kwargs)
+            for i, vector in zip(batch_ids, batch_vectors):
+                vectors[i] = vector.tolist()
+            if cache is not None:
+                cache.put_many([(keys[i], vectors[i]) for i in batch_ids])
+            progress.advance(len(batch_ids))
+
+    summary = progress.summary()
+    summary["cached_chunks"] = len(texts) - len(missing)
+    if cache is not None:
+        summary["cache"] = cache.stats()
+    logger.info("Embedding finished: %s", summary)
+    return vectors, summary
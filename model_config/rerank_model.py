@@ -0,0 +1,112 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Retrieved candidates scored by the cross-encoder before the best top_k are kept
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+# Scoring stops once this much time has passed and retrieval order is used instead
+RERANK_LATENCY_BUDGET_MS = float(os.getenv("RERANK_LATENCY_BUDGET_MS", "300"))
+
+_model = None
+_model_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"reranked": 0, "fallbacks": 0, "total_ms": 0.0, "load_seconds": None}
+
+
+def get_rerank_model():
+    """Returns the process-wide cross-encoder, loading it on CPU on first use."""
+    global _model
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+
+            logger.info("Loading rerank model %s.", RERANK_MODEL_NAME)
+            started = time.perf_counter()
+            _model = CrossEncoder(RERANK_MODEL_NAME, device="cpu", max_length=RERANK_MAX_LENGTH)
+            _stats["load_seconds"] = round(time.perf_counter() - started, 3)
+            logger.info("Rerank model loaded in %.2fs.", _stats["load_seconds"])
+    return _model
+
+
+def warmup_rerank_model():
+    """Loads the cross-encoder and scores one pair, so requests do not pay for it."""
+    get_rerank_model().predict([("warmup", "warmup")])
+
+
+def _record(reranked, elapsed_ms):
+    with _stats_lock:
+        _stats["reranked" if reranked else "fallbacks"] += 1
+        _stats["total_ms"] += elapsed_ms
+
+
+def rerank(query, chunks, top_k, latency_budget_ms=None):
+    """
+    Reorders retrieved chunks by cross-encoder relevance and keeps the best top_k.
+
+    Candidates are scored in batches of RERANK_BATCH_SIZE. If the latency
+    budget runs out before every candidate is scored, the chunks are
+    returned in their original (retrieval) order instead, so the stage never
+    adds more than roughly one batch beyond the budget.
+
+    Args:
+        query (str): The user's query
+        chunks (list[dict]): Retrieved chunks, best first
+        top_k (int): Number of chunks to keep
+        latency_budget_ms (float): Override RERANK_LATENCY_BUDGET_MS
+
+    Returns:
+        list[dict]: Up to top_k chunks; on success their score is the cross-encoder score
+    """
+    if len(chunks) <= 1:
+        return chunks[:top_k]
+
+    budget_ms = RERANK_LATENCY_BUDGET_MS if latency_budget_ms is None else latency_budget_ms
+    started = time.perf_counter()
+    model = get_rerank_model()
+
+    scores = []
+    for start in range(0, len(chunks), RERANK_BATCH_SIZE):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms > budget_ms:
+            logger.warning(
+                "Rerank budget of %.0fms exceeded after %d of %d candidates; using retrieval order.",
+                budget_ms, len(scores), len(chunks)
+            )
+            _record(False, elapsed_ms)
+            return chunks[:top_k]
+        batch = chunks[start:start + RERANK_BATCH_SIZE]
+        pairs = [(query, chunk["page_content"]) for chunk in batch]
+        scores.extend(float(score) for score in model.predict(pairs, batch_size=len(pairs)))
+
+    ranked = sorted(
+        (dict(chunk, score=score) for chunk, score in zip(chunks, scores)),
+        key=lambda chunk: chunk["score"],
+        reverse=True
+    )
+    _record(True, (time.perf_counter() - started) * 1000)
+    return ranked[:top_k]
+
+
+def rerank_stats():
+    """Returns how often reranking completed or fell back, and its mean latency."""
+    with _stats_lock:
+        calls = _stats["reranked"] + _stats["fallbacks"]
+        return {
+            "enabled": RERANK_ENABLED,
+            "model_name": RERANK_MODEL_NAME,
+            "candidates": RERANK_CANDIDATES,
+            "latency_budget_ms": RERANK_LATENCY_BUDGET_MS,
+            "reranked": _stats["reranked"],
+            "fallbacks": _stats["fallbacks"],
+            "mean_ms": round(_stats["total_ms"] / calls, 2) if calls else 0.0,
+            "load_seconds": _stats["load_seconds"]
+        }
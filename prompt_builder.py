@@ -0,0 +1,127 @@
+import os
+import re
+import math
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the retrieved context placed in a prompt, in estimated tokens
+PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "2000"))
+# Word-shingle Jaccard similarity above which two chunks count as duplicates
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("PROMPT_NEAR_DUPLICATE_THRESHOLD", "0.85"))
+# Shortest shared prefix/suffix treated as splitter overlap (chunk_overlap=50)
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 200
+
+CHUNK_SEPARATOR = "\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about four characters per token)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _shingles(text, size=3):
+    words = text.split()
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _overlap_length(previous, text):
+    """Length of the longest suffix of previous that is a prefix of text."""
+    longest = min(len(previous), len(text), MAX_OVERLAP_CHARS)
+    for length in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:length]):
+            return length
+    return 0
+
+
+def _trim_overlap(text, selected):
+    """Strips text that repeats the start or end of an already selected chunk."""
+    for previous in selected:
+        overlap = _overlap_length(previous, text)
+        if overlap:
+            text = text[overlap:]
+        overlap = _overlap_length(text, previous)
+        if overlap:
+            text = text[:-overlap]
+    return text.strip()
+
+
+def build_context(chunks, token_budget=None):
+    """
+    Assembles retrieved chunks into prompt context within a token budget.
+
+    Chunks are taken in descending score order. Exact and near duplicates
+    (e.g. the same page uploaded twice) are dropped, text repeated through
+    the splitter's chunk overlap is trimmed, and chunks stop being added once
+    the next one would exceed the budget.
+
+    Args:
+        chunks (list[dict]): Retrieved chunks with page_content and score
+        token_budget (int): Estimated token limit (defaults to PROMPT_CONTEXT_TOKEN_BUDGET)
+
+    Returns:
+        tuple: (context string, stats dict)
+    """
+    token_budget = PROMPT_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    ordered = sorted(chunks or [], key=lambda chunk: chunk.get("score") or 0.0, reverse=True)
+
+    seen_hashes = set()
+    seen_shingles = []
+    selected = []
+    used_tokens = 0
+    duplicates = 0
+    over_budget = 0
+
+    for chunk in ordered:
+        text = chunk.get("page_content", "").strip()
+        normalized = _normalize(text)
+        if not normalized:
+            continue
+
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        shingles = _shingles(normalized)
+        if digest in seen_hashes or any(
+            _jaccard(shingles, other) >= NEAR_DUPLICATE_THRESHOLD for other in seen_shingles
+        ):
+            duplicates += 1
+            continue
+
+        text = _trim_overlap(text, selected)
+        if not text:
+            duplicates += 1
+            continue
+
+        tokens = estimate_tokens(text) + estimate_tokens(CHUNK_SEPARATOR)
+        if used_tokens + tokens > token_budget:
+            over_budget += 1
+            continue
+
+        seen_hashes.add(digest)
+        seen_shingles.append(shingles)
+        selected.append(text)
+        used_tokens += tokens
+
+    stats = {
+        "chunks_in": len(ordered),
+        "chunks_used": len(selected),
+        "duplicates_removed": duplicates,
+        "over_budget": over_budget,
+        "context_tokens": used_tokens,
+        "token_budget": token_budget
+    }
+    logger.info("Prompt context built: %s", stats)
+    return CHUNK_SEPARATOR.join(selected), stats
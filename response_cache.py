@@ -0,0 +1,160 @@
+import os
+import math
+import logging
+import threading
+from gemini import get_gemini
+from prompt_builder import build_context
+from search_query import embed_query_cached, normalize_query
+from utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400")) or None
+# Cosine similarity above which a differently worded query reuses a cached
+# answer over the same chunks. Off (0) by default: near-identical embeddings
+# can still ask different questions (e.g. "increase" vs "decrease")
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """
+    Caches Gemini answers keyed by (retrieved chunk IDs, normalized query).
+
+    A lookup first tries the exact key. Failing that, and if a similarity
+    threshold is set, it compares the query embedding against cached queries
+    that were answered over the same chunks and reuses the closest one above
+    the threshold.
+    """
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+                 similarity_threshold=RESPONSE_CACHE_SIMILARITY):
+        self.similarity_threshold = similarity_threshold
+        self.semantic_hits = 0
+        self._entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        # chunk key -> normalized queries cached for it (pruned lazily)
+        self._queries_by_chunks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chunk_key(chunk_ids):
+        return tuple(sorted(chunk_ids or ()))
+
+    def get(self, chunk_ids, query):
+        """Returns the cached response for this context and query, or None."""
+        chunk_key = self._chunk_key(chunk_ids)
+        normalized = normalize_query(query)
+        entry = self._entries.get((chunk_key, normalized))
+        if entry is not None:
+            return entry["response"]
+
+        if not self.similarity_threshold:
+            return None
+        with self._lock:
+            candidates = list(self._queries_by_chunks.get(chunk_key, ()))
+        if not candidates:
+            return None
+
+        query_embedding = embed_query_cached(query)
+        best, best_score = None, self.similarity_threshold
+        for candidate in candidates:
+            candidate_entry = self._entries.peek((chunk_key, candidate))
+            if candidate_entry is None:
+                self._forget(chunk_key, candidate)
+                continue
+            score = _cosine(query_embedding, candidate_entry["embedding"])
+            if score >= best_score:
+                best, best_score = candidate_entry, score
+        if best is None:
+            return None
+
+        self.semantic_hits += 1
+        logger.info("Semantic response cache hit (similarity %.3f).", best_score)
+        return best["response"]
+
+    def _forget(self, chunk_key, normalized):
+        """Drops an evicted or expired query from the semantic index."""
+        with self._lock:
+            queries = self._queries_by_chunks.get(chunk_key)
+            if queries is not None:
+                queries.discard(normalized)
+                if not queries:
+                    del self._queries_by_chunks[chunk_key]
+
+    def set(self, chunk_ids, query, response):
+        chunk_key = self._chunk_key(chunk_ids)
+        normalized = normalize_query(query)
+        embedding = embed_query_cached(query) if self.similarity_threshold else None
+        self._entries.set((chunk_key, normalized), {"response": response, "embedding": embedding})
+        with self._lock:
+            self._queries_by_chunks.setdefault(chunk_key, set()).add(normalized)
+
+    def stats(self):
+        stats = self._entries.stats()
+        stats["semantic_hits"] = self.semantic_hits
+        stats["similarity_threshold"] = self.similarity_threshold
+        return stats
+
+
+response_cache = ResponseCache()
+
+
+def get_cached_response(chunk_ids, query, use_cache=True):
+    """Returns a cached answer, or None on a miss or when caching is bypassed."""
+    if not (use_cache and RESPONSE_CACHE_ENABLED and chunk_ids):
+        return None
+    return response_cache.get(chunk_ids, query)
+
+
+def store_response(chunk_ids, query, response, use_cache=True):
+    """Caches an answer unless caching is bypassed."""
+    if use_cache and RESPONSE_CACHE_ENABLED and chunk_ids and response is not None:
+        response_cache.set(chunk_ids, query, response)
+
+
+def cache_context_ids(chunks, history=None):
+    """
+    Returns the context part of a cache key: the retrieved chunk IDs.
+
+    Returns None, meaning the answer is not cached, when nothing was
+    retrieved (the key would be the query alone, shared by every user) or
+    when the turn has history. A follow-up's answer depends on the earlier
+    turns, and any key that captures them changes with every turn, so it
+    could only ever match a retry of the same turn.
+    """
+    if not chunks or history:
+        return None
+    return [chunk["id"] for chunk in chunks]
+
+
+def cached_respond(chunks, query, use_cache=True, history=None):
+    """
+    Answers a query over retrieved chunks, serving repeats from the cache.
+
+    Args:
+        chunks (list[dict] | None): Retrieved chunks (see search_user_chunks)
+        query (str): The user's query
+        use_cache (bool): False bypasses the cache for this request
+        history (str): Conversation history from conversation_history.build_history;
+            turns with history are answered without the cache
+
+    Returns:
+        The parsed Gemini response
+    """
+    chunk_ids = cache_context_ids(chunks, history)
+    response = get_cached_response(chunk_ids, query, use_cache)
+    if response is not None:
+        logger.info("Response served from cache.")
+        return response
+
+    context = build_context(chunks)[0] if chunks else None
+    response = get_gemini().respond(context, query, history)
+    store_response(chunk_ids, query, response, use_cache)
+    return response
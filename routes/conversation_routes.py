@@ -3,6 +3,8 @@ from datetime import datetime, timezone
 from config.db import db
 import logging
 from firebase_admin import firestore
+from db.conversations_db import CONVERSATION_SORT_FIELDS, InvalidCursorError, list_queries, list_user_conversations
+from db.users_db import get_user_by_id, invalidate_user
 
 # Blueprint for conversation routes
 conversation_blueprint = Blueprint('conversation', __name__, url_prefix='/app')
@@ -17,19 +19,19 @@ def update_user_conversations(user_id, conversation_id):
     Updates the user's list of conversation IDs with a new conversation ID.
     """
     try:
-        user_ref = users_collection.document(user_id)
-        user_doc = user_ref.get()
+        user_data = get_user_by_id(user_id)
 
-        if not user_doc.exists:
+        if not user_data:
             logger.error("User with user_id %s not found.", user_id)
             return
 
-        user_data = user_doc.to_dict()
         conversation_ids = user_data.get("conversation_ids", [])
 
         if conversation_id not in conversation_ids:
-            conversation_ids.append(conversation_id)
-            user_ref.update({"conversation_ids": conversation_ids})
+            users_collection.document(user_id).update({
+                "conversation_ids": firestore.ArrayUnion([conversation_id])
+            })
+            invalidate_user(user_id)
             logger.info("Updated user %s with new conversation_id %s", user_id, conversation_id)
     except Exception as e:
         logger.error("Error updating user's conversation_ids: %s", str(e))
@@ -40,32 +42,46 @@ def create_conversation(user_id):
     Creates a new conversation for a given user.
     """
     try:
-        user_ref = users_collection.document(user_id)
-        if not user_ref.get().exists:
+        if not get_user_by_id(user_id):
             return jsonify({"status": "error", "message": "User not found"}), 404
 
         new_conversation = {
             "user_id": user_id,
             "conversation_name": request.json.get('conversation_name', "Unnamed Conversation"),
-            "queries": [],
+            "query_count": 0,
+            "document_count": 0,
             "created_at": datetime.utcnow()
         }
 
         conversation_ref = conversations_collection.add(new_conversation)
         conversation_id = conversation_ref[1].id
 
-        user_ref.update({
+        users_collection.document(user_id).update({
             "conversation_ids": firestore.ArrayUnion([conversation_id])
         })
+        invalidate_user(user_id)
 
         return jsonify({"status": "success", "conversation_id": conversation_id}), 201
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def read_page_args(default_limit=20, max_limit=100, default_order='asc'):
+    """
+    Reads limit/cursor/order pagination arguments from the query string.
+    """
+    try:
+        limit = int(request.args.get('limit', default_limit))
+    except ValueError:
+        limit = default_limit
+    limit = max(1, min(limit, max_limit))
+    cursor = request.args.get('cursor') or None
+    descending = request.args.get('order', default_order).lower() == 'desc'
+    return limit, cursor, descending
+
 @conversation_blueprint.route('/api/conversations/<conversation_id>', methods=['GET'])
 def get_conversation(conversation_id):
     """
-    Retrieves a specific conversation by its ID.
+    Retrieves a specific conversation by its ID with the first page of its queries.
     """
     try:
         if not conversation_id:
@@ -77,28 +93,61 @@ def get_conversation(conversation_id):
         if not conversation.exists:
             return jsonify({"status": "error", "message": "Conversation not found"}), 404
 
+        limit, cursor, descending = read_page_args()
+        conversation_data = conversation.to_dict()
+        conversation_data["queries"], next_cursor = list_queries(conversation_id, limit, cursor, descending)
+
         return jsonify({
             "status": "success",
             "conversation_id": conversation_id,
-            "conversation_data": conversation.to_dict()
+            "conversation_data": conversation_data,
+            "next_cursor": next_cursor
         }), 200
+    except InvalidCursorError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         logger.error("Error retrieving conversation: %s", str(e))
         return jsonify({"status": "error", "message": "An error occurred while retrieving the conversation"}), 500
 
+@conversation_blueprint.route('/api/conversations/<conversation_id>/queries', methods=['GET'])
+def get_conversation_queries(conversation_id):
+    """
+    Retrieves one page of a conversation's queries.
+
+    Query string: limit (default 20, max 100), cursor (next_cursor of the
+    previous page) and order ("asc" oldest first, or "desc").
+    """
+    try:
+        if not conversations_collection.document(conversation_id).get(field_paths=["user_id"]).exists:
+            return jsonify({"status": "error", "message": "Conversation not found"}), 404
+
+        limit, cursor, descending = read_page_args()
+        queries, next_cursor = list_queries(conversation_id, limit, cursor, descending)
+
+        return jsonify({
+            "status": "success",
+            "conversation_id": conversation_id,
+            "queries": queries,
+            "next_cursor": next_cursor
+        }), 200
+    except InvalidCursorError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.error("Error retrieving conversation queries: %s", str(e))
+        return jsonify({"status": "error", "message": "An error occurred while retrieving the queries"}), 500
+
 @conversation_blueprint.route('/api/conversation_ids/<user_id>', methods=['GET'])
 def get_conversation_ids(user_id):
     """
     Retrieves all conversation IDs for a given user.
     """
     try:
-        user_ref = users_collection.document(user_id)
-        user = user_ref.get()
+        user = get_user_by_id(user_id)
 
-        if not user.exists:
+        if not user:
             return jsonify({"status": "error", "message": "User not found"}), 404
 
-        conversation_ids = user.to_dict().get('conversation_ids', [])
+        conversation_ids = user.get('conversation_ids', [])
 
         return jsonify({
             "status": "success",
@@ -111,34 +160,30 @@ def get_conversation_ids(user_id):
 @conversation_blueprint.route('/api/conversation_name/<user_id>', methods=['GET'])
 def get_conversations(user_id):
     """
-    Retrieves all conversation names and IDs for a given user.
+    Retrieves one page of conversation names and IDs for a given user.
+
+    Query string: limit (default 50, max 200), cursor (next_cursor of the
+    previous page), order_by ("created_at" or "conversation_name") and
+    order ("desc", the default, or "asc").
     """
     try:
-        user_ref = users_collection.document(user_id)
-        user = user_ref.get()
-
-        if not user.exists:
+        if not get_user_by_id(user_id):
             return jsonify({"status": "error", "message": "User not found"}), 404
 
-        conversation_ids = user.to_dict().get('conversation_ids', [])
-        conversations = []
-
-        for conversation_id in conversation_ids:
-            conversation_ref = conversations_collection.document(conversation_id)
-            conversation = conversation_ref.get()
+        limit, cursor, descending = read_page_args(default_limit=50, max_limit=200, default_order='desc')
+        order_by = request.args.get('order_by', 'created_at')
+        if order_by not in CONVERSATION_SORT_FIELDS:
+            return jsonify({"status": "error", "message": "Invalid order_by field"}), 400
 
-            if conversation.exists:
-                conversation_data = conversation.to_dict()
-                conversation_name = conversation_data.get("conversation_name", "Unnamed Conversation")
-                conversations.append({
-                    "conversation_id": conversation_id,
-                    "conversation_name": conversation_name
-                })
+        conversations, next_cursor = list_user_conversations(user_id, limit, cursor, order_by, descending)
 
         return jsonify({
             "status": "success",
             "user_id": user_id,
-            "conversations": conversations
+            "conversations": conversations,
+            "next_cursor": next_cursor
         }), 200
+    except InvalidCursorError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
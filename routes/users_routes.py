@@ -1,20 +1,35 @@
 import os
 import re
-from flask import Flask, request, jsonify, Blueprint
-from flask_bcrypt import Bcrypt
+import json
+from flask import Flask, request, jsonify, Blueprint, Response, stream_with_context
 from datetime import datetime, timezone
 from db.users_db import (
+    DuplicateUserError,
     create_user,
-    get_all_users,
+    is_registered,
+    iter_users,
+    list_users,
     get_user_by_email_or_phone,
     get_user_by_id,
     update_user,
     delete_user
 )
+from utils.password_hashing import PasswordHasherBusy, check_password, hash_password, needs_rehash
+from utils.rate_limiter import RateLimiter
 
-# Initialize Blueprint and bcrypt
+# Initialize Blueprint
 users_db = Blueprint('users', __name__)
-bcrypt = Bcrypt()
+
+# Login attempts allowed per identifier within the window; checked before any bcrypt work
+LOGIN_MAX_ATTEMPTS = int(os.getenv("LOGIN_MAX_ATTEMPTS", "5"))
+LOGIN_WINDOW_SECONDS = float(os.getenv("LOGIN_WINDOW_SECONDS", "300"))
+login_limiter = RateLimiter(LOGIN_MAX_ATTEMPTS, LOGIN_WINDOW_SECONDS)
+
+@users_db.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    response = jsonify({'msg': str(e)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 # Validation functions
 def is_valid_email(email):
@@ -51,11 +66,15 @@ def register_user():
     if not is_valid_phone(phone_number):
         return jsonify({'msg': 'Invalid phone number format'}), 400
 
-    if get_user_by_email_or_phone(email=email) or get_user_by_email_or_phone(phone_number=phone_number):
+    # Reject known duplicates before spending a bcrypt hash on them
+    if is_registered(email=email, phone_number=phone_number):
         return jsonify({'msg': 'User with this email or phone already exists'}), 409
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
-    user_id = create_user(name, email, hashed_password, phone_number)
+    hashed_password = hash_password(password)
+    try:
+        user_id = create_user(name, email, hashed_password, phone_number)
+    except DuplicateUserError:
+        return jsonify({'msg': 'User with this email or phone already exists'}), 409
     return jsonify({'user_id': user_id}), 201
 
 @users_db.route('/api/users/<user_id>', methods=['GET', 'PUT', 'DELETE'])
@@ -71,10 +90,13 @@ def user_operations(user_id):
         if 'password' in data:
             if not is_valid_password(data['password']):
                 return jsonify({'msg': 'Invalid password format'}), 400
-            data['password'] = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+            data['password'] = hash_password(data['password'])
         if 'phone_number' in data and not is_valid_phone(data['phone_number']):
             return jsonify({'msg': 'Invalid phone number format'}), 400
-        update_user(user_id, data)
+        try:
+            update_user(user_id, data)
+        except DuplicateUserError:
+            return jsonify({'msg': 'User with this email or phone already exists'}), 409
         return jsonify({'msg': 'User updated successfully'}), 200
 
     if request.method == 'DELETE':
@@ -91,7 +113,13 @@ def login_user():
     if not identifier or not password:
         return jsonify({'msg': 'Identifier and password are required'}), 400
 
-    
+    limiter_key = str(identifier).strip().lower()
+    allowed, retry_after = login_limiter.hit(limiter_key)
+    if not allowed:
+        response = jsonify({'msg': 'Too many login attempts; try again later'})
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+        return response, 429
+
     phone = identifier if type(identifier) == int else None
     email = None if phone else identifier if '@' in identifier else None
     # email = identifier if '@' in identifier else None
@@ -99,17 +127,48 @@ def login_user():
     print("Phone:", phone)
     print("Email:", email)
     
-    user = get_user_by_email_or_phone(email=email, phone_number=phone)
+    # Read straight from Firestore so the hash checked is never a stale cached copy
+    user = get_user_by_email_or_phone(email=email, phone_number=phone, use_cache=False)
 
-    if user and bcrypt.check_password_hash(user['password'], password):
+    if user and check_password(user['password'], password):
+        login_limiter.reset(limiter_key)
         user_id = user['_id']
         login_time = datetime.now(timezone.utc)
-        update_user(user_id, {'last_login': login_time})
+        update_data = {'last_login': login_time}
+        if needs_rehash(user['password']):
+            # Stored cost is out of date; upgrade it while the plaintext is at hand
+            update_data['password'] = hash_password(password)
+        update_user(user_id, update_data)
         return jsonify({'user_id': user_id, 'login_time': login_time.isoformat()}), 200
 
     return jsonify({'msg': 'Invalid identifier or password'}), 401
 
+# Page size limits for /api/users
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "100"))
+USERS_MAX_PAGE_SIZE = int(os.getenv("USERS_MAX_PAGE_SIZE", "1000"))
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
 @users_db.route('/api/users', methods=['GET'])
 def fetch_all_users():
-    users = get_all_users()
-    return jsonify({'users': users}), 200
+    """
+    Lists users without their password hashes.
+
+    By default one page is returned with a next_cursor to pass back as
+    ?cursor=. With ?format=ndjson every user is streamed, one JSON object per
+    line, as Firestore yields them.
+    """
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            for user in iter_users():
+                yield json.dumps(user, default=_json_default) + "\n"
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    try:
+        limit = int(request.args.get('limit', USERS_PAGE_SIZE))
+    except ValueError:
+        limit = USERS_PAGE_SIZE
+    limit = max(1, min(limit, USERS_MAX_PAGE_SIZE))
+    users, next_cursor = list_users(limit=limit, cursor=request.args.get('cursor') or None)
+    return jsonify({'users': users, 'next_cursor': next_cursor}), 200
@@ -40,7 +40,6 @@
 #         "collection_name": "GenMind_3"
 #     }
 
-from langchain.vectorstores import Qdrant
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.document_loaders import (
     PyPDFLoader,
@@ -48,9 +47,22 @@ from langchain.document_loaders import (
     Docx2txtLoader,
     UnstructuredImageLoader
 )
-from config.vector_db import qdrant_client
-from model_config.embed_model import model_embedding
+from qdrant_client.models import PointStruct
+from db.keyword_index import get_keyword_index
+from db.vector_store import collection_for_user, get_vector_store
+from model_config.embedding_engine import EMBED_BATCH_SIZE, embed_documents
 import os
+import time
+import uuid
+import queue
+import threading
+
+# Streaming ingestion: chunks are embedded in windows of this many batches,
+# and at most PIPELINE_QUEUE_SIZE windows wait between consecutive stages
+PIPELINE_WINDOW_BATCHES = int(os.getenv("PIPELINE_WINDOW_BATCHES", "4"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+_DONE = object()
 
 def get_document_loader(file_path):
     """Returns appropriate document loader based on file extension."""
@@ -67,47 +79,190 @@ def get_document_loader(file_path):
     else:
         raise ValueError(f"Unsupported file type: {file_extension}")
 
-def file_vectorizing(user_id, conversation_id, file_path):
-    """Vectorizes file content and stores in Qdrant."""
+def chunk_point_id(file_path, chunk_index):
+    """Deterministic point ID, so re-running an upload overwrites instead of duplicating."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{file_path}#{chunk_index}"))
+
+def iter_pages(loader):
+    """Yields pages one at a time, falling back to load() for loaders without lazy_load."""
     try:
-        # Get appropriate loader
-        loader = get_document_loader(file_path)
-        documents = loader.load()
+        yield from loader.lazy_load()
+    except NotImplementedError:
+        yield from loader.load()
+
+def _put(stage_queue, item, stop):
+    """Puts onto a bounded queue, giving up if another stage has failed."""
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(stage_queue, stop):
+    """Takes from a bounded queue, returning _DONE if another stage has failed."""
+    while True:
+        try:
+            return stage_queue.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                return _DONE
+
+def file_vectorizing(user_id, conversation_id, file_path, batch_size=None, num_threads=None,
+                     progress_callback=None):
+    """
+    Vectorizes file content and stores in Qdrant (and the keyword index).
+
+    The file is processed as a stream: a parser thread yields pages and their
+    chunks in windows, the calling thread embeds each window, and an upsert
+    thread writes the vectors. Bounded queues between the stages keep memory
+    flat regardless of file size while all three stages run concurrently.
+
+    progress_callback, if given, is called as (stage, done, total) for the
+    load, split, embed and upsert stages; total is None until the stage ends.
+    """
+    def report(stage, done, total=None):
+        if progress_callback:
+            progress_callback(stage, done, total)
+
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    window_size = batch_size * PIPELINE_WINDOW_BATCHES
+    metadata = {
+        "user_id": user_id,
+        "conversation_id": conversation_id,
+        "file_path": file_path
+    }
+
+    collection_name = collection_for_user(user_id)
+    chunk_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    upsert_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    errors = []
+    counts = {"pages": 0, "chunks": 0, "embedded": 0, "cached": 0, "upserted": 0}
 
-        # Split documents into chunks
+    def run_stage(target):
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    def parse_stage():
+        loader = get_document_loader(file_path)
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=500,
             chunk_overlap=50
         )
-        texts = text_splitter.split_documents(documents)
-
-        # Add metadata to each chunk
-        for text in texts:
-            if not hasattr(text, 'metadata'):
-                text.metadata = {}
-            text.metadata.update({
-                "user_id": user_id,
-                "conversation_id": conversation_id,
-                "file_path": file_path
-            })
-
-        # Create Qdrant vector database
-        qdrant = Qdrant.from_documents(
-            texts,
-            model_embedding(),
-            url="https://23d3e77b-82ee-4929-8efe-5291110b98b9.europe-west3-0.gcp.cloud.qdrant.io:6333",
-            prefer_grpc=False,
-            collection_name="GenMind_3",
-            api_key="dq8OJwrHsyk6IVMFGpufuBC1PHDzSQjICQrV0Y9EDsT2olTsvIp5bg"
-        )
+        window = []
+        try:
+            for page in iter_pages(loader):
+                counts["pages"] += 1
+                report("load", counts["pages"])
+                for text in text_splitter.split_documents([page]):
+                    if not hasattr(text, 'metadata'):
+                        text.metadata = {}
+                    text.metadata.update(metadata)
+                    window.append((counts["chunks"], text))
+                    counts["chunks"] += 1
+                    if len(window) >= window_size:
+                        if not _put(chunk_queue, window, stop):
+                            return
+                        window = []
+                report("split", counts["chunks"])
+            if window:
+                _put(chunk_queue, window, stop)
+        finally:
+            _put(chunk_queue, _DONE, stop)
+
+    def upsert_stage():
+        vector_store = get_vector_store()
+        keyword_index = get_keyword_index()
+        while True:
+            batch = _get(upsert_queue, stop)
+            if batch is _DONE:
+                return
+            vector_store.ensure_collection(collection_name, len(batch[0][2]))
+            point_ids = [chunk_point_id(file_path, index) for index, _, _ in batch]
+            # Store vectors using LangChain's payload layout so search keeps working
+            vector_store.upsert(
+                collection_name,
+                [
+                    PointStruct(
+                        id=point_id,
+                        vector=vector,
+                        payload={
+                            "page_content": text.page_content,
+                            "metadata": text.metadata
+                        }
+                    )
+                    for point_id, (_, text, vector) in zip(point_ids, batch)
+                ]
+            )
+            # Same point IDs in the keyword index, so hybrid search can fuse on them
+            if keyword_index is not None:
+                keyword_index.add_chunks(
+                    user_id,
+                    conversation_id,
+                    [(point_id, text.page_content, text.metadata) for point_id, (_, text, _) in zip(point_ids, batch)]
+                )
+            counts["upserted"] += len(batch)
+            report("upsert", counts["upserted"])
+
+    try:
+        parser = threading.Thread(target=run_stage, args=(parse_stage,), name="ingest-parse", daemon=True)
+        upserter = threading.Thread(target=run_stage, args=(upsert_stage,), name="ingest-upsert", daemon=True)
+        parser.start()
+        upserter.start()
+
+        started = time.perf_counter()
+        try:
+            while True:
+                window = _get(chunk_queue, stop)
+                if window is _DONE:
+                    break
+                vectors, window_stats = embed_documents(
+                    [text.page_content for _, text in window],
+                    batch_size=batch_size,
+                    num_threads=num_threads
+                )
+                counts["embedded"] += len(window)
+                counts["cached"] += window_stats["cached_chunks"]
+                report("embed", counts["embedded"])
+                batch = [(index, text, vector) for (index, text), vector in zip(window, vectors)]
+                if not _put(upsert_queue, batch, stop):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(upsert_queue, _DONE, stop)
+            parser.join()
+            upserter.join()
+
+        if errors:
+            raise errors[0]
+
+        seconds = time.perf_counter() - started
+        embedding_stats = {
+            "chunks": counts["embedded"],
+            "cached_chunks": counts["cached"],
+            "seconds": round(seconds, 3),
+            "chunks_per_second": round(counts["embedded"] / seconds, 2) if seconds > 0 else 0.0
+        }
+        report("load", counts["pages"], counts["pages"])
+        report("split", counts["chunks"], counts["chunks"])
+        report("embed", counts["embedded"], counts["chunks"])
+        report("upsert", counts["upserted"], counts["chunks"])
 
         return {
             "message": "User-specific vectors added successfully!",
             "user_id": user_id,
             "conversation_id": conversation_id,
             "file_path": file_path,
-            "collection_name": "GenMind_3"
+            "collection_name": collection_name,
+            "embedding_stats": embedding_stats
         }
         
     except Exception as e:
-        raise Exception(f"Error vectorizing file: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error vectorizing file: {str(e)}")
@@ -1,45 +1,228 @@
-from config.vector_db import qdrant_client
-from model_config.embed_model import model_embedding
+import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchValue
+from db.keyword_index import get_keyword_index
+from db.vector_store import CONVERSATION_ID_FIELD, USER_ID_FIELD, collection_for_user, get_vector_store
+from model_config.embed_model import MODEL_CACHE_ID, ENCODE_KWARGS, model_embedding
+from model_config.rerank_model import RERANK_CANDIDATES, RERANK_ENABLED, rerank
+from utils.lru_cache import LRUCache
 
-def search_user_data(query: str, user_id: str, top_k: int = 5):
+logger = logging.getLogger(__name__)
+
+# Query embeddings keyed on (model identity, normalized query text)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "0")) or None
+query_embedding_cache = LRUCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+def normalize_query(query: str) -> str:
+    """Collapses whitespace and case so trivially different queries share a cache entry."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+def embed_query_cached(query: str):
     """
-    Search vectors for a specific user in the collection.
-    
+    Returns the embedding for a query, serving repeats from the in-process LRU cache.
+
+    The normalized text is what gets embedded, so a cached vector is exactly
+    what a fresh forward pass would produce for the same key.
+    """
+    normalized = normalize_query(query)
+    key = (MODEL_CACHE_ID, ENCODE_KWARGS.get("normalize_embeddings", False), normalized)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        embedding = model_embedding().embed_query(normalized)
+        query_embedding_cache.set(key, embedding)
+    return embedding
+
+# Hybrid retrieval: BM25 keyword hits fused with dense hits by reciprocal rank
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() in ("1", "true", "yes")
+# Candidates fetched from each retriever per requested result
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "4"))
+# RRF damping constant; 60 is the value from the original RRF paper
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Keyword searches run here so they overlap with the dense search
+_keyword_search_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("HYBRID_SEARCH_WORKERS", "4")),
+    thread_name_prefix="keyword-search"
+)
+
+def query_cache_stats():
+    """Returns hit/miss counters for the query embedding cache."""
+    return query_embedding_cache.stats()
+
+def build_user_filter(user_id: str, conversation_ids=None) -> Filter:
+    """
+    Builds the payload filter for a user's chunks, optionally scoped to conversations.
+
+    Args:
+        user_id (str): The user ID to filter results
+        conversation_ids (str | list[str] | None): One conversation, several,
+            or None for all of the user's documents
+
+    Returns:
+        Filter: Qdrant filter on the indexed metadata fields
+    """
+    must = [
+        FieldCondition(
+            key=USER_ID_FIELD,
+            match=MatchValue(value=user_id)
+        )
+    ]
+    if isinstance(conversation_ids, str):
+        must.append(FieldCondition(key=CONVERSATION_ID_FIELD, match=MatchValue(value=conversation_ids)))
+    elif conversation_ids is not None:
+        must.append(FieldCondition(key=CONVERSATION_ID_FIELD, match=MatchAny(any=list(conversation_ids))))
+    return Filter(must=must)
+
+def reciprocal_rank_fusion(result_lists, limit, k=None):
+    """
+    Merges ranked chunk lists by reciprocal rank fusion.
+
+    Each chunk scores sum(1 / (k + rank)) over the lists it appears in, so
+    chunks ranked well by both retrievers rise to the top regardless of how
+    the retrievers' raw scores compare.
+
+    Returns:
+        list[dict]: Up to limit chunks with the fused score, best first
+    """
+    k = RRF_K if k is None else k
+    fused = {}
+    for results in result_lists:
+        for rank, chunk in enumerate(results, start=1):
+            entry = fused.setdefault(chunk["id"], dict(chunk, score=0.0))
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda chunk: chunk["score"], reverse=True)[:limit]
+
+def dense_search(query: str, user_id: str, limit: int, conversation_ids=None, oversampling=None, rescore=None):
+    """
+    Returns the user's chunks closest to the query embedding.
+
+    oversampling and rescore tune search over quantized collections
+    (see db.vector_store.search_params).
+    """
+    # Generate query embedding
+    query_embedding = embed_query_cached(query)
+
+    # Perform search with user (and conversation) prefilter
+    results = get_vector_store().search(
+        collection_name=collection_for_user(user_id),
+        query_vector=query_embedding,
+        query_filter=build_user_filter(user_id, conversation_ids),
+        limit=limit,
+        oversampling=oversampling,
+        rescore=rescore
+    )
+
+    return [
+        {
+            "id": str(result.id),
+            "score": result.score,
+            "page_content": result.payload.get('page_content', ''),
+            "metadata": result.payload.get('metadata', {})
+        }
+        for result in results or []
+    ]
+
+def keyword_search(query: str, user_id: str, limit: int, conversation_ids=None):
+    """Returns the user's chunks that best match the query terms by BM25."""
+    keyword_index = get_keyword_index()
+    if keyword_index is None:
+        return []
+    return keyword_index.search(query, user_id, limit=limit, conversation_ids=conversation_ids)
+
+def retrieve_chunks(query: str, user_id: str, limit: int, conversation_ids=None, hybrid=None,
+                    oversampling=None, rescore=None):
+    """
+    Returns up to limit candidate chunks from dense search, fused with BM25
+    keyword hits by reciprocal rank fusion when hybrid search is on.
+
+    The keyword search runs concurrently with the dense search, so hybrid
+    retrieval adds no serial latency.
+    """
+    hybrid = HYBRID_SEARCH_ENABLED if hybrid is None else hybrid
+    if not hybrid or get_keyword_index() is None:
+        return dense_search(query, user_id, limit, conversation_ids, oversampling, rescore)
+
+    candidates = limit * HYBRID_CANDIDATE_MULTIPLIER
+    keyword_future = _keyword_search_pool.submit(keyword_search, query, user_id, candidates, conversation_ids)
+    dense_results = dense_search(query, user_id, candidates, conversation_ids, oversampling, rescore)
+    try:
+        keyword_results = keyword_future.result()
+    except Exception as e:
+        # The keyword index is an accelerator; dense results alone are still valid
+        logger.error("Keyword search failed, using dense results only: %s", str(e))
+        return dense_results[:limit]
+
+    return reciprocal_rank_fusion([dense_results, keyword_results], limit)
+
+def search_user_chunks(query: str, user_id: str, top_k: int = 5, conversation_ids=None, hybrid=None,
+                       rerank_results=None, oversampling=None, rescore=None):
+    """
+    Search vectors for a specific user and return the matching chunks.
+
+    With hybrid search on, exact terms (acronyms, equation names, section
+    numbers) are found even when the embedding misses them. With reranking
+    on, RERANK_CANDIDATES chunks are retrieved and a CPU cross-encoder keeps
+    the best top_k, within a latency budget.
+
     Args:
         query (str): The search query
         user_id (str): The user ID to filter results
         top_k (int): Number of top results to return
-        
+        conversation_ids (str | list[str] | None): Restrict the search to one
+            conversation or a list of them; None searches all of the user's documents
+        hybrid (bool): Override HYBRID_SEARCH_ENABLED for this call
+        rerank_results (bool): Override RERANK_ENABLED for this call
+        oversampling (float): Quantized-search candidate multiplier
+            (defaults to VECTOR_SEARCH_OVERSAMPLING)
+        rescore (bool): Rescore quantized candidates with the original vectors
+            (defaults to VECTOR_SEARCH_RESCORE)
+
     Returns:
-        str: Concatenated content from matching documents
+        list[dict]: Chunks with id, score, page_content and metadata, best first
     """
     try:
-        # Generate query embedding
-        query_embedding = model_embedding().embed_query(query)
-
-        # Perform search with user filter
-        results = qdrant_client.search(
-            collection_name="GenMind_3",
-            query_vector=query_embedding,
-            query_filter={
-                "must": [
-                    {
-                        "key": "metadata.user_id",
-                        "match": {"value": user_id}
-                    }
-                ]
-            },
-            limit=top_k
-        )
+        if conversation_ids is not None and not isinstance(conversation_ids, str) and not conversation_ids:
+            return []
 
-        # Concatenate and return results
-        if results:
-            return " ".join(
-                result.payload.get('page_content', '')
-                for result in results
-            )
-        
-        return ""
+        rerank_results = RERANK_ENABLED if rerank_results is None else rerank_results
+        if not rerank_results:
+            return retrieve_chunks(query, user_id, top_k, conversation_ids, hybrid, oversampling, rescore)
+
+        candidates = retrieve_chunks(
+            query, user_id, max(RERANK_CANDIDATES, top_k), conversation_ids, hybrid, oversampling, rescore
+        )
+        try:
+            return rerank(query, candidates, top_k)
+        except Exception as e:
+            logger.error("Reranking failed, using retrieval order: %s", str(e))
+            return candidates[:top_k]
 
     except Exception as e:
-        raise Exception(f"Error searching user data: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error searching user data: {str(e)}")
+
+def format_context(chunks) -> str:
+    """Joins retrieved chunks into the context string passed to Gemini."""
+    return " ".join(chunk["page_content"] for chunk in chunks)
+
+def search_user_data(query: str, user_id: str, top_k: int = 5, conversation_ids=None,
+                     oversampling=None, rescore=None):
+    """
+    Search vectors for a specific user in the collection.
+    
+    Args:
+        query (str): The search query
+        user_id (str): The user ID to filter results
+        top_k (int): Number of top results to return
+        conversation_ids (str | list[str] | None): Restrict the search to one
+            conversation or a list of them; None searches all of the user's documents
+        oversampling (float): Quantized-search candidate multiplier
+        rescore (bool): Rescore quantized candidates with the original vectors
+        
+    Returns:
+        str: Concatenated content from matching documents
+    """
+    return format_context(search_user_chunks(
+        query, user_id, top_k, conversation_ids, oversampling=oversampling, rescore=rescore
+    ))
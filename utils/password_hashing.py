@@ -0,0 +1,98 @@
+import os
+import re
+import atexit
+import multiprocessing
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# bcrypt cost factor (log2 rounds) for new hashes; stored hashes with a
+# different cost are rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Worker processes doing bcrypt work, so CPU-bound rounds never run on the
+# Flask request thread
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Hash/verify calls allowed in flight (running + queued) before new ones are refused
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8)))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "5"))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "30"))
+
+_COST_PATTERN = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when the hashing pool is saturated; the request should be retried later."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(hashed_password, password):
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
+    except ValueError:
+        # Malformed stored hash
+        return False
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # forkserver: forking a threaded worker holding gRPC channels and
+                # torch thread pools can deadlock the children. Preload only this
+                # module, so the fork server does not import the app's __main__.
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+                _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=context)
+                logger.info("Password hashing pool started with %d workers.", PASSWORD_HASH_WORKERS)
+    return _pool
+
+
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_shutdown_pool)
+
+
+def _run(fn, *args):
+    if not _slots.acquire(timeout=PASSWORD_HASH_QUEUE_TIMEOUT):
+        raise PasswordHasherBusy("Too many concurrent password operations; try again later.")
+    try:
+        return _get_pool().submit(fn, *args).result(timeout=PASSWORD_HASH_TIMEOUT)
+    finally:
+        _slots.release()
+
+
+def hash_password(password, rounds=None):
+    """Returns a bcrypt hash of password computed in the hashing pool."""
+    return _run(_hash, password, BCRYPT_ROUNDS if rounds is None else rounds)
+
+
+def check_password(hashed_password, password):
+    """Verifies password against a stored bcrypt hash in the hashing pool."""
+    if not hashed_password or not password:
+        return False
+    return _run(_check, hashed_password, password)
+
+
+def hash_cost(hashed_password):
+    """Returns the cost factor encoded in a bcrypt hash, or None if unrecognised."""
+    match = _COST_PATTERN.match(hashed_password or "")
+    return int(match.group(1)) if match else None
+
+
+def needs_rehash(hashed_password):
+    """True when a stored hash was made with a cost other than BCRYPT_ROUNDS."""
+    return hash_cost(hashed_password) != BCRYPT_ROUNDS
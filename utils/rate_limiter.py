@@ -0,0 +1,51 @@
+import time
+import threading
+from utils.lru_cache import LRUCache
+
+
+class RateLimiter:
+    """
+    Fixed-window attempt counter per key (e.g. a login identifier).
+
+    Counters live in a bounded LRU cache whose TTL is the window length, so
+    memory stays capped however many distinct keys are tried.
+    """
+
+    def __init__(self, max_attempts, window_seconds, maxsize=100000):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self.rejected = 0
+        self._windows = LRUCache(maxsize=maxsize, ttl=window_seconds)
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """
+        Records an attempt for key.
+
+        Returns:
+            tuple: (allowed, seconds until the window resets)
+        """
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.peek(key)
+            if window is None:
+                window = {"started_at": now, "count": 0}
+                self._windows.set(key, window)
+            window["count"] += 1
+            retry_after = max(0.0, window["started_at"] + self.window_seconds - now)
+            if window["count"] > self.max_attempts:
+                self.rejected += 1
+                return False, retry_after
+            return True, retry_after
+
+    def reset(self, key):
+        """Clears the attempts recorded for key (e.g. after a successful login)."""
+        self._windows.pop(key)
+
+    def stats(self):
+        return {
+            "max_attempts": self.max_attempts,
+            "window_seconds": self.window_seconds,
+            "tracked_keys": len(self._windows),
+            "rejected": self.rejected
+        }